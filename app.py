@@ -1,8 +1,14 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import folium
-from streamlit_folium import st_folium
 from datetime import datetime
+from exporter import EXPORT_FORMATS, export_bytes, write_frame
+from filter_index import FilterIndex
+from geocode import boundary_index, locate
+from map_layers import ColumnarMarkerLayer, RenderCache, lookup, route_layer, use_bulk_markers
+from routing import plan_route
+from timing import start_rerun
 
 # --- Data Loading --
 @st.cache_data
@@ -22,37 +28,108 @@ def load_customer_data():
         'Loan_Amount': [25000, 15000, 50000, 35000],
         'Loan_Status': ['Approved', 'Pending', 'Rejected', 'Approved'],
         'Risk_Score': [65, 42, 88, 71],
-        'Last_Contact': ['2023-08-15', '2023-09-02', '2023-07-20', '2023-09-10'],
+        'Last_Contact': pd.to_datetime(['2023-08-15', '2023-09-02', '2023-07-20', '2023-09-10']),
         'Sales_Rep': ['Rep1', 'Rep2', 'Rep1', 'Rep3']
     })
 
+@st.cache_resource
+def load_filter_index():
+    """Customer data with categorical columns and prebuilt filter bitmaps"""
+    customers = load_customer_data()
+    province, _ = locate(customers['Latitude'], customers['Longitude'])
+    customers['Province'] = pd.Series(province, index=customers.index).fillna('Unknown')
+    return FilterIndex(
+        customers,
+        categorical=['Loan_Status', 'Business_Type', 'Sales_Rep', 'Province'],
+        ranges=['Loan_Amount', 'Last_Contact']
+    )
+
+# --- Dashboard Metrics ---
+HIGH_RISK_SCORE = 75
+METRIC_KEYS = ['Loan_Status', 'Business_Type', 'Sales_Rep', 'Province']
+
+def summarize_customers(data):
+    """Customer, approval, loan and high-risk totals per status, business type and rep"""
+    return (
+        data.assign(Approved=data['Loan_Status'] == 'Approved', High_Risk=data['Risk_Score'] > HIGH_RISK_SCORE)
+        .groupby(METRIC_KEYS, observed=True)
+        .agg(customers=('Customer_ID', 'size'), approved=('Approved', 'sum'),
+             loan_total=('Loan_Amount', 'sum'), high_risk=('High_Risk', 'sum'))
+    )
+
+@st.cache_resource
+def load_metric_summary():
+    """Pre-aggregated totals behind the dashboard tiles, built once with the filter index"""
+    return summarize_customers(load_filter_index().data)
+
+def dashboard_totals(summary, selections):
+    """Add up the summary cells matching the sidebar selections"""
+    mask = np.ones(len(summary), dtype=bool)
+    for column, selected in selections.items():
+        mask &= summary.index.get_level_values(column).isin(selected)
+    return summary[mask].sum()
+
 # --- Map Visualization ---
+STATUS_COLORS = {'Approved': 'green', 'Pending': 'orange'}
+BUSINESS_ICONS = {'Agriculture': 'briefcase', 'Retail': 'shopping-cart'}
+
+def customer_popups(data):
+    """Build the popup HTML for every row at once from the frame's columns"""
+    return (
+        "<h4>" + data['Name'] + "</h4>"
+        + "<b>Business:</b> " + data['Business_Type'].astype(str) + " (" + data['Business_Years'].astype(str) + " yrs)<br>"
+        + "<b>Loan:</b> $" + data['Loan_Amount'].map('{:,}'.format).astype(str) + " | " + data['Loan_Status'].astype(str) + "<br>"
+        + "<b>Collateral:</b> " + data['Collateral_Type'] + " ($" + data['Collateral_Value'].map('{:,}'.format).astype(str) + ")<br>"
+        + "<b>Last Contact:</b> " + data['Last_Contact'].dt.strftime('%Y-%m-%d')
+    )
+
 def create_customer_map(data):
     m = folium.Map(location=[12.5657, 104.9910], zoom_start=7)  # Center on Cambodia
     
-    for idx, row in data.iterrows():
-        html = f"""
-        <h4>{row['Name']}</h4>
-        <b>Business:</b> {row['Business_Type']} ({row['Business_Years']} yrs)<br>
-        <b>Loan:</b> ${row['Loan_Amount']:,} | {row['Loan_Status']}<br>
-        <b>Collateral:</b> {row['Collateral_Type']} (${row['Collateral_Value']:,})<br>
-        <b>Last Contact:</b> {row['Last_Contact']}
-        """
-        
+    colors = lookup(data['Loan_Status'], STATUS_COLORS, 'red')
+    icons = lookup(data['Business_Type'], BUSINESS_ICONS, 'building')
+    tooltips = data['Name'] + " - " + data['Loan_Status'].astype(str)
+    popups = customer_popups(data)
+    
+    # Large books go out as one clustered layer built from the column arrays
+    if use_bulk_markers(data):
+        ColumnarMarkerLayer(
+            data['Latitude'], data['Longitude'], colors, icons,
+            tooltip=tooltips, popup=popups, name="Customers"
+        ).add_to(m)
+        return m
+    
+    for lat, lon, color, icon, tooltip, html in zip(
+            data['Latitude'], data['Longitude'], colors, icons, tooltips, popups):
         folium.Marker(
-            [row['Latitude'], row['Longitude']],
+            [lat, lon],
             popup=folium.Popup(html, max_width=300),
-            tooltip=f"{row['Name']} - {row['Loan_Status']}",
-            icon=folium.Icon(
-                color='green' if row['Loan_Status']=='Approved' else 
-                     'orange' if row['Loan_Status']=='Pending' else 'red',
-                icon='briefcase' if row['Business_Type']=='Agriculture' else
-                     'shopping-cart' if row['Business_Type']=='Retail' else 'building'
-            )
+            tooltip=tooltip,
+            icon=folium.Icon(color=color, icon=icon)
         ).add_to(m)
     
     return m
 
+# --- Route Planning ---
+MAX_ROUTE_STOPS = 300
+
+def plan_rep_route(data):
+    """The customers in visiting order and the route length in km"""
+    order, km = plan_route(data['Latitude'], data['Longitude'])
+    return data.iloc[order], km
+
+def create_route_map(route):
+    m = folium.Map(location=[route['Latitude'].mean(), route['Longitude'].mean()], zoom_start=10)
+    route_layer(route['Latitude'], route['Longitude'], route['Name']).add_to(m)
+    m.fit_bounds([[route['Latitude'].min(), route['Longitude'].min()],
+                  [route['Latitude'].max(), route['Longitude'].max()]])
+    return m
+
+@st.cache_resource
+def load_map_cache():
+    """Rendered customer maps, shared by every session"""
+    return RenderCache()
+
 # --- Customer Detail View ---
 def show_customer_details(row):
     with st.expander(f"🔍 {row['Name']} - {row['Customer_ID']}", expanded=True):
@@ -79,11 +156,75 @@ def show_customer_details(row):
             st.write(f"💲 **Value:** ${row['Collateral_Value']:,}")
         
         st.write(f"👔 **Sales Rep:** {row['Sales_Rep']}")
-        st.write(f"📅 **Last Contact:** {row['Last_Contact']}")
+        st.write(f"📅 **Last Contact:** {row['Last_Contact']:%Y-%m-%d}")
+
+# --- Search and Sort ---
+SORT_COLUMNS = {
+    'Loan Amount (High-Low)': 'Loan_Amount',
+    'Risk Score (High-Low)': 'Risk_Score',
+    'Last Contact (Recent)': 'Last_Contact',
+}
+
+def search_customers(data, search_term):
+    """Rows whose name or ID contains the search term, ignoring case"""
+    if not search_term:
+        return data
+    return data[
+        data['Name'].str.contains(search_term, case=False) |
+        data['Customer_ID'].str.contains(search_term, case=False)
+    ]
+
+def sort_customers(data, sort_by):
+    """Sort the whole result set, highest or most recent first"""
+    return data.sort_values(SORT_COLUMNS[sort_by], ascending=False)
+
+# --- Last Contact Windows ---
+# label -> (contacted at least this many days ago, within this many days)
+CONTACT_WINDOWS = {
+    'Any time': (None, None),
+    'Contacted in the last 30 days': (None, 30),
+    'Contacted in the last 90 days': (None, 90),
+    'Not contacted in 90+ days': (90, None),
+}
+
+def contact_range(window, bounds, today=None):
+    """(earliest, latest) Last_Contact for a window, whole days so it is stable within a day"""
+    older_than, within = CONTACT_WINDOWS[window]
+    today = np.datetime64(today or pd.Timestamp.today().normalize(), 'ns')
+    earliest = today - np.timedelta64(within, 'D') if within is not None else bounds[0]
+    latest = today - np.timedelta64(older_than, 'D') if older_than is not None else bounds[1]
+    return earliest, latest
+
+# --- Paged Customer List ---
+PAGE_SIZES = [10, 25, 50]
+
+def _move_cursor(step, total):
+    st.session_state.card_cursor = min(max(st.session_state.card_cursor + step, 0), max(total - 1, 0))
+
+def show_customer_page(data, page_size, view_key):
+    """Render the cards for one page of an already sorted result set"""
+    # Any change to filters, search or sort starts the list from the top again
+    if st.session_state.get('card_view') != view_key:
+        st.session_state.card_view = view_key
+        st.session_state.card_cursor = 0
+    
+    total = len(data)
+    start = st.session_state.card_cursor - st.session_state.card_cursor % page_size
+    for _, row in data.iloc[start:start + page_size].iterrows():
+        show_customer_details(row)
+        st.divider()
+    
+    prev_col, info_col, next_col = st.columns([1, 3, 1])
+    prev_col.button("⬅️ Previous", disabled=start == 0,
+                    on_click=_move_cursor, args=(-page_size, total))
+    info_col.caption(f"Showing {min(start + 1, total)}-{min(start + page_size, total)} of {total} customers")
+    next_col.button("Next ➡️", disabled=start + page_size >= total,
+                    on_click=_move_cursor, args=(page_size, total))
 
 # --- Main App ---
 def main():
     st.set_page_config(page_title="Sales Team Portal", layout="wide", page_icon="👔")
+    timings = start_rerun("app")
     
     # --- Authentication ---
     if 'authenticated' not in st.session_state:
@@ -107,7 +248,9 @@ def main():
     st.title("👔 Customer Loan Management Portal")
     st.markdown("**Sales Team Dashboard** | Access customer details and loan information")
     
-    customer_data = load_customer_data()
+    with timings.span("load customers"):
+        filter_index = load_filter_index()
+    customer_data = filter_index.data
     
     # --- Sidebar Filters ---
     with st.sidebar:
@@ -115,95 +258,148 @@ def main():
         
         selected_status = st.multiselect(
             "Loan Status",
-            options=customer_data['Loan_Status'].unique(),
-            default=customer_data['Loan_Status'].unique()
+            options=filter_index.options['Loan_Status'],
+            default=filter_index.options['Loan_Status']
         )
         
         selected_business = st.multiselect(
             "Business Type",
-            options=customer_data['Business_Type'].unique(),
-            default=customer_data['Business_Type'].unique()
+            options=filter_index.options['Business_Type'],
+            default=filter_index.options['Business_Type']
         )
         
         selected_rep = st.multiselect(
             "Sales Representative",
-            options=customer_data['Sales_Rep'].unique(),
-            default=customer_data['Sales_Rep'].unique()
+            options=filter_index.options['Sales_Rep'],
+            default=filter_index.options['Sales_Rep']
         )
         
+        # Without the boundaries file every customer is 'Unknown', so there is nothing to filter on
+        if boundary_index() is not None:
+            selected_province = st.multiselect(
+                "Province",
+                options=filter_index.options['Province'],
+                default=filter_index.options['Province']
+            )
+        else:
+            selected_province = filter_index.options['Province']
+        
+        min_loan, max_loan = filter_index.bounds('Loan_Amount')
         loan_range = st.slider(
             "Loan Amount Range ($)",
-            min_value=int(customer_data['Loan_Amount'].min()),
-            max_value=int(customer_data['Loan_Amount'].max()),
-            value=(0, int(customer_data['Loan_Amount'].max())))
+            min_value=int(min_loan),
+            max_value=int(max_loan),
+            value=(0, int(max_loan)))
+        
+        contact_window = st.selectbox("Last Contact", list(CONTACT_WINDOWS))
     
     # Apply filters
-    filtered_data = customer_data[
-        (customer_data['Loan_Status'].isin(selected_status)) &
-        (customer_data['Business_Type'].isin(selected_business)) &
-        (customer_data['Sales_Rep'].isin(selected_rep)) &
-        (customer_data['Loan_Amount'] >= loan_range[0]) &
-        (customer_data['Loan_Amount'] <= loan_range[1])
-    ]
+    selections = {
+        'Loan_Status': selected_status,
+        'Business_Type': selected_business,
+        'Sales_Rep': selected_rep,
+        'Province': selected_province,
+    }
+    ranges = {'Loan_Amount': tuple(loan_range)}
+    if contact_window != 'Any time':
+        ranges['Last_Contact'] = contact_range(contact_window, filter_index.bounds('Last_Contact'))
+    with timings.span("filter") as span:
+        filtered_data = customer_data.iloc[filter_index.filter(selections, ranges)]
+        span['rows'] = len(filtered_data)
     
     # --- Dashboard Metrics ---
+    # Read from the pre-aggregated cells unless a range filter cuts through them
+    with timings.span("metrics"):
+        if loan_range[0] <= min_loan and loan_range[1] >= max_loan and 'Last_Contact' not in ranges:
+            totals = dashboard_totals(load_metric_summary(), selections)
+        else:
+            totals = summarize_customers(filtered_data).sum()
+    customers = int(totals.get('customers', 0))
+    
     col1, col2, col3, col4 = st.columns(4)
-    col1.metric("Total Customers", len(filtered_data))
+    col1.metric("Total Customers", customers)
     col2.metric("Approval Rate", 
-               f"{len(filtered_data[filtered_data['Loan_Status']=='Approved'])/len(filtered_data)*100:.1f}%")
+               f"{totals['approved'] / customers * 100:.1f}%" if customers else "–")
     col3.metric("Avg Loan Amount", 
-               f"${filtered_data['Loan_Amount'].mean():,.0f}")
+               f"${totals['loan_total'] / customers:,.0f}" if customers else "–")
     col4.metric("High Risk Customers", 
-               len(filtered_data[filtered_data['Risk_Score'] > 75]))
+               int(totals.get('high_risk', 0)))
     
     # --- Map View ---
     st.subheader("Geographic Distribution")
     st.caption("Click markers for customer details")
-    customer_map = create_customer_map(filtered_data)
-    st_folium(customer_map, width=1200, height=1000)
+    # Only a change of data or filters builds a new map; other reruns reuse the HTML
+    map_key = tuple((column, tuple(sorted(selected))) for column, selected in selections.items())
+    map_key += tuple(ranges.items())
+    with timings.span("map build") as span:
+        map_html = load_map_cache().get(
+            filter_index.version, map_key,
+            lambda: create_customer_map(filtered_data).get_root().render()
+        )
+        span['payload_bytes'] = len(map_html)
+    with timings.span("map display"):
+        st.iframe(map_html, width=1200, height=1000)
+    
+    # --- Route Planner ---
+    if st.toggle("🧭 Plan a route for a sales rep"):
+        route_rep = st.selectbox("Sales Rep", filter_index.options['Sales_Rep'])
+        stops = filtered_data[filtered_data['Sales_Rep'] == route_rep].head(MAX_ROUTE_STOPS)
+        if stops.empty:
+            st.info("This rep has no customers matching the current filters")
+        else:
+            with timings.span("route") as span:
+                route, km = plan_rep_route(stops)
+                span['stops'] = len(route)
+            st.caption(f"{len(route)} stops, {km:,.1f} km in this order")
+            route_html = load_map_cache().get(
+                filter_index.version, ('route', route_rep) + map_key,
+                lambda: create_route_map(route).get_root().render()
+            )
+            st.iframe(route_html, width=1200, height=600)
+            st.dataframe(
+                route[['Name', 'Phone', 'Location', 'Loan_Status']].assign(Stop=range(1, len(route) + 1)),
+                hide_index=True,
+                column_order=['Stop', 'Name', 'Phone', 'Location', 'Loan_Status']
+            )
     
     # --- Customer List View ---
     st.subheader("Customer Details")
     
-    search_col, sort_col = st.columns(2)
+    search_col, sort_col, size_col = st.columns([2, 2, 1])
     with search_col:
         search_term = st.text_input("Search by Name or ID")
     with sort_col:
-        sort_by = st.selectbox("Sort By", 
-                             ['Loan Amount (High-Low)', 'Risk Score (High-Low)', 
-                              'Last Contact (Recent)'])
+        sort_by = st.selectbox("Sort By", list(SORT_COLUMNS))
+    with size_col:
+        page_size = st.selectbox("Cards per page", PAGE_SIZES)
     
     # Apply search and sort
-    if search_term:
-        filtered_data = filtered_data[
-            filtered_data['Name'].str.contains(search_term, case=False) |
-            filtered_data['Customer_ID'].str.contains(search_term, case=False)
-        ]
-    
-    if sort_by == 'Loan Amount (High-Low)':
-        filtered_data = filtered_data.sort_values('Loan_Amount', ascending=False)
-    elif sort_by == 'Risk Score (High-Low)':
-        filtered_data = filtered_data.sort_values('Risk_Score', ascending=False)
-    else:
-        filtered_data = filtered_data.sort_values('Last_Contact', ascending=False)
-    
-    # Display customer cards
-    for _, row in filtered_data.iterrows():
-        show_customer_details(row)
-        st.divider()
+    with timings.span("search + sort") as span:
+        filtered_data = sort_customers(search_customers(filtered_data, search_term), sort_by)
+        span['rows'] = len(filtered_data)
+    
+    # Display customer cards, one page of the sorted result at a time
+    view_key = map_key + (search_term, sort_by)
+    with timings.span("customer cards"):
+        show_customer_page(filtered_data, page_size, view_key)
     
     # --- Data Export ---
+    # The file is only built, chunk by chunk, when the button is clicked
+    export_format = st.sidebar.selectbox("Export format", list(EXPORT_FORMATS))
+    extension, mime = EXPORT_FORMATS[export_format]
     st.sidebar.download_button(
         label="📥 Export Customer Data",
-        data=filtered_data.to_csv(index=False),
-        file_name=f"customer_data_{datetime.now().strftime('%Y%m%d')}.csv",
-        mime="text/csv"
+        data=lambda: export_bytes(write_frame, filtered_data, fmt=export_format),
+        file_name=f"customer_data_{datetime.now().strftime('%Y%m%d')}{extension}",
+        mime=mime
     )
     
     # Logout button
     if st.sidebar.button("🚪 Logout"):
         st.session_state.authenticated = False
         st.rerun()
+    
+    timings.finish()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,24 @@
+import argparse
+import sys
+from datetime import datetime, timedelta
+
+import locations_db
+from locations_db import archive_visits, init_db
+
+ARCHIVE_AFTER_DAYS = 365
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move old visits from locations into locations_archive")
+    parser.add_argument("--db", default=locations_db.DB_NAME, help="SQLite database file")
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS, help="archive visits older than this many days")
+    args = parser.parse_args(argv)
+
+    locations_db.DB_NAME = args.db
+    init_db()
+    cutoff = datetime.now() - timedelta(days=args.days)
+    moved = archive_visits(cutoff)
+    print(f"Archived {moved:,} visits from before {cutoff:%Y-%m-%d %H:%M}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,242 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+import app
+import customer_images
+import locations_db
+from exporter import EXPORT_FORMATS, export_bytes, write_frame
+from filter_index import FilterIndex
+from locations_db import LOCATION_COLUMNS, connect, init_db, invalidate_location_cache, load_from_db
+
+SIZES = (1_000, 10_000, 100_000, 1_000_000)
+THUMBNAIL_SAMPLE = 20
+
+# (lat, lon, spread in degrees, share of points) for the main towns; the rest fall anywhere in the country
+CITIES = [
+    (11.5564, 104.9282, 0.08, 0.40),  # Phnom Penh
+    (13.3633, 103.8564, 0.05, 0.15),  # Siem Reap
+    (13.0957, 103.2022, 0.05, 0.10),  # Battambang
+    (10.6275, 103.5225, 0.04, 0.07),  # Sihanoukville
+    (12.0000, 105.4500, 0.05, 0.08),  # Kampong Cham
+]
+CAMBODIA_BOUNDS = (10.4, 102.3, 14.7, 107.6)
+
+def synthetic_coordinates(n, rng):
+    """Visit coordinates clustered around Cambodian towns with a countryside background"""
+    shares = [share for *_, share in CITIES]
+    city = rng.choice(len(CITIES) + 1, size=n, p=shares + [1 - sum(shares)])
+    south, west, north, east = CAMBODIA_BOUNDS
+    lat = rng.uniform(south, north, n)
+    lon = rng.uniform(west, east, n)
+    for i, (c_lat, c_lon, spread, _) in enumerate(CITIES):
+        in_city = city == i
+        lat[in_city] = rng.normal(c_lat, spread, in_city.sum())
+        lon[in_city] = rng.normal(c_lon, spread, in_city.sum())
+    return lat, lon
+
+def synthetic_locations(n, rng):
+    """Rows shaped like the locations table from init_db()"""
+    lat, lon = synthetic_coordinates(n, rng)
+    timestamps = pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.integers(0, 2 * 365 * 86400, n), unit="s")
+    return pd.DataFrame({
+        "name": [f"Shop {i}" for i in range(n)],
+        "phone": [f"0{p}" for p in rng.integers(10_000_000, 99_999_999, n)],
+        "type": rng.choice(["Prospect", "Existing", "VIP", "Repeat"], n),
+        "address": None,
+        "lat": lat,
+        "lon": lon,
+        "notes": rng.choice(["", "Follow up next week", "Interested in a larger loan"], n),
+        "image_path": None,
+        "display_path": None,
+        "thumb_path": None,
+        "province": None,
+        "district": None,
+        "timestamp": timestamps.strftime("%Y-%m-%d %H:%M:%S"),
+    })[list(LOCATION_COLUMNS)]
+
+def synthetic_customers(n, rng):
+    """Rows shaped like load_customer_data() in app.py"""
+    lat, lon = synthetic_coordinates(n, rng)
+    last_contact = pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.integers(0, 365, n), unit="D")
+    return pd.DataFrame({
+        "Customer_ID": [f"C{i:07d}" for i in range(n)],
+        "Name": [f"Customer {i}" for i in range(n)],
+        "Phone": [f"0{p}" for p in rng.integers(10_000_000, 99_999_999, n)],
+        "Location": rng.choice(["Phnom Penh", "Siem Reap", "Battambang", "Sihanoukville", "Kampong Cham"], n),
+        "Latitude": lat,
+        "Longitude": lon,
+        "Business_Type": rng.choice(["Retail", "Agriculture", "Construction", "Tourism"], n),
+        "Business_Years": rng.integers(0, 30, n),
+        "Education": rng.choice(["Bachelor", "High School", "Vocational", "Master"], n),
+        "Collateral_Type": rng.choice(["Land", "Vehicle", "Equipment", "House"], n),
+        "Collateral_Value": rng.integers(1_000, 200_000, n),
+        "Loan_Amount": rng.integers(1_000, 100_000, n),
+        "Loan_Status": rng.choice(["Approved", "Pending", "Rejected"], n),
+        "Risk_Score": rng.integers(0, 101, n),
+        "Last_Contact": last_contact,
+        "Sales_Rep": rng.choice([f"Rep{i}" for i in range(1, 51)], n),
+    })
+
+def write_locations(rows):
+    """Append synthetic rows to the current DB_NAME"""
+    conn = connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany(
+            f"INSERT INTO locations ({', '.join(LOCATION_COLUMNS)}) VALUES ({', '.join('?' * len(LOCATION_COLUMNS))})",
+            rows.itertuples(index=False, name=None)
+        )
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+def measure(run, setup=None, repeat=1):
+    """Time run() `repeat` times, then once more under tracemalloc for peak memory"""
+    seconds = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        run()
+        seconds.append(time.perf_counter() - start)
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        result = run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, {"seconds": seconds, "best_s": min(seconds), "peak_mb": peak / 2 ** 20}
+
+def bench_size(n, workdir, rng, repeat, report):
+    """Run every row-count dependent stage at one size"""
+    locations_db.DB_NAME = os.path.join(workdir, f"locations_{n}.db")
+    init_db()
+    write_locations(synthetic_locations(n, rng))
+    extra = synthetic_locations(max(n // 100, 1), rng)
+
+    report("load_from_db (cold)", n, *measure(load_from_db, setup=invalidate_location_cache, repeat=repeat))
+    report("load_from_db (+1% rows)", n, *measure(load_from_db, setup=lambda: write_locations(extra), repeat=repeat))
+
+    customers = synthetic_customers(n, rng)
+    html, stats = measure(lambda: app.create_customer_map(customers).get_root().render(), repeat=repeat)
+    report("create_customer_map + render", n, None, stats, payload_bytes=len(html.encode()))
+
+    index, stats = measure(lambda: FilterIndex(
+        customers, categorical=["Loan_Status", "Business_Type", "Sales_Rep"], ranges=["Loan_Amount"]
+    ), repeat=repeat)
+    report("filter index build", n, None, stats)
+
+    selections = {
+        "Loan_Status": ["Approved", "Pending"],
+        "Business_Type": ["Retail", "Agriculture"],
+        "Sales_Rep": [f"Rep{i}" for i in range(1, 26)],
+    }
+    query = lambda: index.filter(selections, {"Loan_Amount": (10_000, 60_000)})
+    positions, stats = measure(query, setup=index._cache.clear, repeat=repeat)
+    report("filter query (uncached)", n, None, stats, matched=len(positions))
+    report("filter query (cached)", n, *measure(query, repeat=repeat))
+
+    filtered = index.data.iloc[positions]
+    for sort_by in app.SORT_COLUMNS:
+        report(f"search + sort: {sort_by}", n,
+               *measure(lambda: app.sort_customers(app.search_customers(filtered, "customer 1"), sort_by),
+                        repeat=repeat))
+
+    for fmt in [fmt for fmt in ("CSV", "Parquet") if fmt in EXPORT_FORMATS]:
+        data, stats = measure(lambda: export_bytes(write_frame, customers, fmt=fmt), repeat=repeat)
+        report(f"export {fmt}", n, None, stats, payload_bytes=len(data))
+
+def bench_thumbnails(workdir, rng, repeat, report):
+    """Thumbnail a sample of phone-sized photos, cold and from the cache"""
+    image_dir = os.path.join(workdir, "images")
+    os.makedirs(image_dir, exist_ok=True)
+    paths = []
+    for i in range(THUMBNAIL_SAMPLE):
+        path = os.path.join(image_dir, f"photo_{i}.jpg")
+        pixels = rng.integers(0, 255, (1200, 1600, 3), dtype=np.uint8)
+        Image.fromarray(pixels).save(path, quality=90)
+        paths.append(path)
+
+    customer_images.THUMBNAIL_DIR = os.path.join(workdir, "thumbnails")
+    clear = lambda: (shutil.rmtree(customer_images.THUMBNAIL_DIR, ignore_errors=True),
+                     os.makedirs(customer_images.THUMBNAIL_DIR))
+    run = lambda: [customer_images.get_thumbnail(path) for path in paths]
+    report("get_thumbnail (cold)", THUMBNAIL_SAMPLE, *measure(run, setup=clear, repeat=repeat))
+    report("get_thumbnail (cached)", THUMBNAIL_SAMPLE, *measure(run, repeat=repeat))
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(current, baseline_path):
+    """Print how each stage's best time moved against an earlier results file"""
+    with open(baseline_path) as f:
+        baseline = {(r["stage"], r["rows"]): r for r in json.load(f)["results"]}
+    print(f"\n{'stage':<45}{'rows':>10}{'before':>10}{'after':>10}{'ratio':>8}")
+    for r in current:
+        old = baseline.get((r["stage"], r["rows"]))
+        if old:
+            print(f"{r['stage']:<45}{r['rows']:>10,}{old['best_s']:>10.4f}{r['best_s']:>10.4f}"
+                  f"{r['best_s'] / max(old['best_s'], 1e-9):>8.2f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the portal hot paths on synthetic data")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES), help="row counts to test")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="benchmark_results.json", help="where to write the JSON results")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    results = []
+
+    def report(stage, rows, _result, stats, **extra):
+        results.append({"stage": stage, "rows": rows, **stats, **extra})
+        print(f"{stage:<45}{rows:>10,}{stats['best_s']:>10.4f}s{stats['peak_mb']:>10.1f} MB")
+
+    with tempfile.TemporaryDirectory(prefix="portal-bench-") as workdir:
+        bench_thumbnails(workdir, rng, args.repeat, report)
+        for n in args.sizes:
+            bench_size(n, workdir, rng, args.repeat, report)
+            invalidate_location_cache()
+
+    with open(args.output, "w") as f:
+        json.dump({
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "versions": {"numpy": np.__version__, "pandas": pd.__version__},
+            "sizes": args.sizes,
+            "repeat": args.repeat,
+            "seed": args.seed,
+            "results": results,
+        }, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
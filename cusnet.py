@@ -2,10 +2,13 @@ import streamlit as st
 from streamlit_folium import st_folium
 import folium
 from datetime import datetime
+import sqlite3
+from submission_queue import resume_flusher, submit_visit
 
 st.set_page_config(page_title="Customer Map", layout="wide")  # 🔥 This enables full width
 
 st.title("📌 Customer Network Collection")
+resume_flusher()  # flush anything left queued from before a restart
 
 
 # Create a Folium map centered at a default location
@@ -65,5 +68,9 @@ with col2:
                     'notes': notes,
                     'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                 }
-                st.success("✅ Customer location saved!")
-                st.json(new_location)  # Replace with DB or Google Sheet
+                try:
+                    submit_visit(new_location)
+                except sqlite3.Error as e:
+                    st.error(f"Database error: {str(e)}")
+                else:
+                    st.success("✅ Customer location saved!")
@@ -0,0 +1,90 @@
+import hashlib
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+# Configuration
+IMAGE_DIR = "customer_images"
+THUMBNAIL_DIR = os.path.join(IMAGE_DIR, "thumbnails")
+os.makedirs(THUMBNAIL_DIR, exist_ok=True)
+IMAGE_WORKERS = 2
+DISPLAY_SIZE = (1280, 1280)
+THUMBNAIL_SIZE = (200, 200)
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _image_pool():
+    """Process-wide worker pool that writes uploaded images off the request path"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="image-ingest")
+        return _pool
+
+def _write_atomic(path, write):
+    """Write a file through a temporary name so readers never see a partial file"""
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+def _ingest_image(content, image_path, display_path, thumb_path):
+    """Store an original upload and its display and thumbnail versions"""
+    try:
+        if not os.path.exists(image_path):
+            def write_original(path):
+                with open(path, "wb") as f:
+                    f.write(content)
+            _write_atomic(image_path, write_original)
+
+        img = ImageOps.exif_transpose(Image.open(io.BytesIO(content))).convert("RGB")
+        for path, size, quality in ((display_path, DISPLAY_SIZE, 85), (thumb_path, THUMBNAIL_SIZE, 75)):
+            if not os.path.exists(path):
+                derivative = img.copy()
+                derivative.thumbnail(size)
+                _write_atomic(path, lambda p: derivative.save(p, format="JPEG", quality=quality, optimize=True))
+    except Exception:
+        logger.exception("Failed to ingest image %s", image_path)
+
+def save_image(uploaded_file):
+    """Queue an uploaded image for background storage and return its paths"""
+    if not uploaded_file:
+        return None
+        
+    # Name files by content hash so identical uploads share one copy
+    content = uploaded_file.getvalue()
+    digest = hashlib.sha256(content).hexdigest()
+    ext = uploaded_file.name.split('.')[-1].lower()
+    paths = {
+        'image_path': os.path.join(IMAGE_DIR, f"{digest}.{ext}"),
+        'display_path': os.path.join(IMAGE_DIR, f"{digest}_display.jpg"),
+        'thumb_path': os.path.join(IMAGE_DIR, f"{digest}_thumb.jpg"),
+    }
+    
+    if not all(os.path.exists(path) for path in paths.values()):
+        _image_pool().submit(_ingest_image, content, *paths.values())
+        
+    return paths
+
+def get_thumbnail(image_path, size=THUMBNAIL_SIZE):
+    """Return the path of a cached thumbnail, creating it on first request"""
+    if not isinstance(image_path, str) or not os.path.exists(image_path):
+        return None
+
+    # Keyed by path and mtime so a replaced image gets a fresh thumbnail
+    mtime = os.stat(image_path).st_mtime_ns
+    key = hashlib.sha1(f"{os.path.abspath(image_path)}:{mtime}".encode()).hexdigest()
+    thumb_path = os.path.join(THUMBNAIL_DIR, f"{key}.jpg")
+
+    if not os.path.exists(thumb_path):
+        img = Image.open(image_path)
+        img.thumbnail(size)
+        img = img.convert("RGB")
+        _write_atomic(thumb_path, lambda p: img.save(p, format="JPEG", quality=80))
+    return thumb_path
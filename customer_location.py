@@ -1,8 +1,11 @@
 import streamlit as st
 from datetime import datetime
+import sqlite3
+from submission_queue import resume_flusher, submit_visit
 from streamlit_js_eval import streamlit_js_eval
 
 st.title("📍 Customer Visit Location Uploader")
+resume_flusher()  # flush anything left queued from before a restart
 
 # Get location using JavaScript (works on mobile)
 location = streamlit_js_eval(js_expressions="navigator.geolocation.getCurrentPosition",
@@ -45,5 +48,9 @@ with st.form("customer_form"):
                 'notes': notes,
                 'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             }
-            st.success("✅ Customer visit saved!")
-            st.json(new_location)  # You can replace this with saving to DB or Google Sheets
+            try:
+                submit_visit(new_location)
+            except sqlite3.Error as e:
+                st.error(f"Database error: {str(e)}")
+            else:
+                st.success("✅ Customer visit saved!")
@@ -0,0 +1,123 @@
+import argparse
+import sys
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import locations_db
+from geo import KM_PER_DEGREE_LAT, haversine_km
+from locations_db import connect, customers_within, init_db, query_frame
+
+# Two visits closer than this that share a phone or name are flagged as the same customer
+DUPLICATE_RADIUS_M = 100
+
+def normalize_phones(phones):
+    """Reduce Cambodian phone numbers to bare local digits (e.g. +855 12-345-678 -> 012345678)"""
+    digits = pd.Series(phones, dtype=object).fillna("").astype(str).str.replace(r"\D", "", regex=True)
+    digits = digits.str.replace(r"^8550?", "0", regex=True)  # +855 012... keeps a single trunk zero
+    return digits.where(digits.str.startswith("0") | (digits == ""), "0" + digits)
+
+def normalize_names(names):
+    """Lowercase names and collapse whitespace so spelling variants in case/spacing match"""
+    names = pd.Series(names, dtype=object).fillna("").astype(str)
+    return names.str.lower().str.replace(r"\s+", " ", regex=True).str.strip()
+
+def find_duplicates(record, radius_m=DUPLICATE_RADIUS_M):
+    """Existing customers near a new record that share its phone or name"""
+    nearby = customers_within(record['lat'], record['lon'], radius_m / 1000)
+    if nearby.empty:
+        return nearby
+
+    phone = normalize_phones([record['phone']]).iloc[0]
+    name = normalize_names([record['name']]).iloc[0]
+    same_phone = (normalize_phones(nearby['phone']) == phone).to_numpy() & (phone != "")
+    same_name = (normalize_names(nearby['name']) == name).to_numpy() & (name != "")
+    return nearby[same_phone | same_name]
+
+def find_duplicate_pairs(data, radius_m=DUPLICATE_RADIUS_M):
+    """Find candidate duplicate pairs across a whole table without comparing every pair.
+
+    Rows are blocked by a grid of cells at least radius_m wide, and only
+    rows sharing a phone or name key in the same or a neighbouring cell
+    are joined. Returns id_a < id_b pairs with distance_m and the reason.
+    """
+    lat_cell = radius_m / 1000 / KM_PER_DEGREE_LAT
+    lon_cell = lat_cell / max(np.cos(np.radians(data['lat'].abs().max())), 1e-6)
+    frame = pd.DataFrame({
+        'id': data['id'].to_numpy(),
+        'lat': data['lat'].to_numpy(),
+        'lon': data['lon'].to_numpy(),
+        'row': np.floor(data['lat'].to_numpy() / lat_cell).astype(np.int64),
+        'col': np.floor(data['lon'].to_numpy() / lon_cell).astype(np.int64),
+    })
+
+    # Integer codes join much faster than strings; -1 marks a blank key
+    for key, normalized in (('phone', normalize_phones(data['phone'])), ('name', normalize_names(data['name']))):
+        codes, _ = pd.factorize(normalized.to_numpy())
+        frame[key] = np.where(normalized.to_numpy() == "", -1, codes)
+
+    matches = []
+    for key in ('phone', 'name'):
+        block = frame.loc[frame[key] >= 0, ['id', 'lat', 'lon', 'row', 'col', key]]
+        for d_row in (-1, 0, 1):
+            for d_col in (-1, 0, 1):
+                shifted = block.assign(row=block['row'] + d_row, col=block['col'] + d_col)
+                joined = block.merge(shifted, on=[key, 'row', 'col'], suffixes=('_a', '_b'))
+                joined = joined[joined['id_a'] < joined['id_b']]
+                matches.append(joined[['id_a', 'id_b', 'lat_a', 'lon_a', 'lat_b', 'lon_b']].assign(reason=key))
+
+    pairs = pd.concat(matches, ignore_index=True)
+    pairs['distance_m'] = haversine_km(pairs['lat_a'], pairs['lon_a'], pairs['lat_b'], pairs['lon_b']) * 1000
+    pairs = pairs[pairs['distance_m'] <= radius_m]
+    return (
+        pairs.groupby(['id_a', 'id_b'], as_index=False)
+        .agg(distance_m=('distance_m', 'first'), reason=('reason', lambda r: ",".join(sorted(set(r)))))
+    )
+
+def write_merge_candidates(pairs):
+    """Replace the merge_candidates table with a fresh set of pairs"""
+    conn = connect()
+    try:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS merge_candidates (
+                id_a INTEGER NOT NULL,
+                id_b INTEGER NOT NULL,
+                distance_m REAL NOT NULL,
+                reason TEXT NOT NULL,
+                detected_at TEXT NOT NULL,
+                PRIMARY KEY (id_a, id_b)
+            )
+        """)
+        detected_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("DELETE FROM merge_candidates")
+        conn.executemany(
+            "INSERT INTO merge_candidates VALUES (?, ?, ?, ?, ?)",
+            ((int(a), int(b), float(d), r, detected_at)
+             for a, b, d, r in pairs[['id_a', 'id_b', 'distance_m', 'reason']].itertuples(index=False))
+        )
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find likely duplicate customers in the locations table")
+    parser.add_argument("--db", default=locations_db.DB_NAME, help="SQLite database file")
+    parser.add_argument("--radius", type=float, default=DUPLICATE_RADIUS_M, help="match radius in meters")
+    parser.add_argument("--csv", help="also write the candidates to this CSV file")
+    args = parser.parse_args(argv)
+
+    locations_db.DB_NAME = args.db
+    init_db()
+    data = query_frame("SELECT id, name, phone, lat, lon FROM locations")
+    pairs = find_duplicate_pairs(data, args.radius)
+    write_merge_candidates(pairs)
+    if args.csv:
+        pairs.to_csv(args.csv, index=False)
+
+    print(f"{len(pairs):,} merge candidates among {len(data):,} rows written to merge_candidates")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+import argparse
+import csv
+import gzip
+import io
+import sys
+from contextlib import contextmanager
+
+import locations_db
+from locations_db import reader
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = pq = None
+
+CHUNK_SIZE = 50000
+
+# format -> (file extension, MIME type)
+EXPORT_FORMATS = {
+    "CSV": (".csv", "text/csv"),
+    "CSV (gzip)": (".csv.gz", "application/gzip"),
+}
+if pq is not None:
+    EXPORT_FORMATS["Parquet"] = (".parquet", "application/vnd.apache.parquet")
+
+def _require_parquet():
+    if pq is None:
+        raise ValueError("Parquet export needs pyarrow installed")
+
+@contextmanager
+def _text_sink(sink, fmt):
+    """Text stream over a binary sink, gzip-compressed for 'CSV (gzip)'; leaves the sink open"""
+    target = gzip.GzipFile(fileobj=sink, mode="wb", compresslevel=6) if fmt == "CSV (gzip)" else sink
+    text = io.TextIOWrapper(target, encoding="utf-8", newline="")
+    try:
+        yield text
+    finally:
+        text.flush()
+        text.detach()
+        if target is not sink:
+            target.close()
+
+def write_chunks(columns, chunks, sink, fmt="CSV"):
+    """Write an iterable of row chunks (lists of tuples) to a binary sink"""
+    if fmt == "Parquet":
+        _require_parquet()
+        writer = None
+        for rows in chunks:
+            table = pa.Table.from_arrays([pa.array(values) for values in zip(*rows)], names=columns)
+            if writer is None:
+                # Columns that are all NULL in the first chunk have no type yet; treat them as text
+                schema = pa.schema([
+                    field.with_type(pa.string()) if pa.types.is_null(field.type) else field
+                    for field in table.schema
+                ])
+                writer = pq.ParquetWriter(sink, schema, compression="zstd")
+            writer.write_table(table.cast(writer.schema))
+        if writer is None:
+            writer = pq.ParquetWriter(sink, pa.schema([(name, pa.string()) for name in columns]))
+        writer.close()
+        return
+
+    with _text_sink(sink, fmt) as text:
+        out = csv.writer(text)
+        out.writerow(columns)
+        for rows in chunks:
+            out.writerows(rows)
+
+def write_frame(data, sink, fmt="CSV", chunk_size=CHUNK_SIZE):
+    """Stream a DataFrame to a sink chunk by chunk"""
+    if fmt == "Parquet":
+        _require_parquet()
+        table = pa.Table.from_pandas(data, preserve_index=False)
+        pq.write_table(table, sink, row_group_size=chunk_size, compression="zstd")
+        return
+
+    with _text_sink(sink, fmt) as text:
+        for start in range(0, max(len(data), 1), chunk_size):
+            data.iloc[start:start + chunk_size].to_csv(text, index=False, header=start == 0)
+
+def write_query(sql, sink, fmt="CSV", params=(), chunk_size=CHUNK_SIZE):
+    """Stream the result of a SELECT straight from SQLite to a sink, without pandas"""
+    with reader() as conn:
+        c = conn.execute(sql, params)
+        columns = [d[0] for d in c.description]
+        chunks = iter(lambda: c.fetchmany(chunk_size), [])
+        write_chunks(columns, chunks, sink, fmt)
+
+def export_bytes(write, *args, **kwargs):
+    """Run one of the write_* functions into memory and return the file contents"""
+    buffer = io.BytesIO()
+    write(*args, buffer, **kwargs)
+    return buffer.getvalue()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the locations table to CSV, gzipped CSV or Parquet")
+    parser.add_argument("path", help="output file; the format follows its extension")
+    parser.add_argument("--db", default=locations_db.DB_NAME, help="SQLite database file")
+    args = parser.parse_args(argv)
+
+    fmt = next(
+        (name for name, (ext, _) in sorted(EXPORT_FORMATS.items(), key=lambda f: -len(f[1][0]))
+         if args.path.endswith(ext)),
+        "CSV"
+    )
+    locations_db.DB_NAME = args.db
+    with open(args.path, "wb") as sink:
+        write_query("SELECT * FROM locations ORDER BY id", sink, fmt)
+    print(f"Exported locations to {args.path} ({fmt})")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+import itertools
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+_versions = itertools.count(1)
+
+class FilterIndex:
+    """Prebuilt index for the sidebar filters of a customer frame.
+
+    Each categorical column gets one packed bitmap per value, so an isin()
+    filter is an OR of a few bitmaps; numeric range columns get a sorted
+    copy, so a range filter is two binary searches. Results are memoized
+    by filter state.
+    """
+
+    def __init__(self, data, categorical, ranges, cache_size=64):
+        self.data = data.astype({column: "category" for column in categorical})
+        self.size = len(data)
+        self.version = next(_versions)  # identifies this build for caches keyed on the data
+        self.options = {}
+        self.bitmaps = {}
+        for column in categorical:
+            codes = self.data[column].cat.codes.to_numpy()
+            self.options[column] = list(self.data[column].unique())
+            self.bitmaps[column] = {
+                value: np.packbits(codes == code)
+                for code, value in enumerate(self.data[column].cat.categories)
+            }
+
+        self.sorted = {}
+        for column in ranges:
+            values = self.data[column].to_numpy()
+            order = np.argsort(values, kind="stable")
+            self.sorted[column] = (values[order], order)
+
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+
+    def bounds(self, column):
+        """Smallest and largest value of a range column"""
+        values, _ = self.sorted[column]
+        return values[0], values[-1]
+
+    def _range_bitmap(self, column, low, high):
+        values, order = self.sorted[column]
+        start = np.searchsorted(values, low, side="left")
+        stop = np.searchsorted(values, high, side="right")
+        mask = np.zeros(self.size, dtype=bool)
+        mask[order[start:stop]] = True
+        return np.packbits(mask)
+
+    def _filter(self, selections, ranges):
+        result = None
+        for column, selected in selections:
+            # Selecting every value filters nothing, so skip the bitmap work
+            if set(selected) >= set(self.options[column]):
+                continue
+            bitmap = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+            for value in selected:
+                if value in self.bitmaps[column]:
+                    bitmap |= self.bitmaps[column][value]
+            result = bitmap if result is None else result & bitmap
+
+        for column, (low, high) in ranges:
+            bitmap = self._range_bitmap(column, low, high)
+            result = bitmap if result is None else result & bitmap
+
+        if result is None:
+            return np.arange(self.size)
+        return np.flatnonzero(np.unpackbits(result, count=self.size))
+
+    def filter(self, selections, ranges=None):
+        """Row positions matching {column: selected values} and {column: (low, high)}"""
+        key = (
+            tuple(sorted((column, frozenset(values)) for column, values in selections.items())),
+            tuple(sorted((ranges or {}).items())),
+        )
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        positions = self._filter(key[0], key[1])
+        positions.flags.writeable = False
+        with self._lock:
+            self._cache[key] = positions
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return positions
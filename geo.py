@@ -0,0 +1,16 @@
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 111.195
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km; broadcasts over NumPy arrays"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+def bbox_around(lat, lon, radius_km):
+    """Return a (south, west, north, east) box that contains a circle of radius_km"""
+    dlat = radius_km / KM_PER_DEGREE_LAT
+    dlon = min(radius_km / (KM_PER_DEGREE_LAT * max(np.cos(np.radians(lat)), 1e-6)), 180.0)
+    return (lat - dlat, lon - dlon, lat + dlat, lon + dlon)
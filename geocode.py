@@ -0,0 +1,173 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+
+import numpy as np
+import pandas as pd
+
+import locations_db
+from locations_db import connect, init_db
+
+# Cambodian district boundaries as GeoJSON, e.g. OCHA's khm_admbnda_adm2 from HDX
+BOUNDARIES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "boundaries", "khm_adm2.geojson")
+PROVINCE_FIELD = "ADM1_EN"
+DISTRICT_FIELD = "ADM2_EN"
+CHUNK_SIZE = 50000
+EDGE_BLOCK = 4_000_000  # point x polygon-edge pairs tested at once
+
+logger = logging.getLogger(__name__)
+
+def _ring_edges(ring):
+    ring = np.asarray(ring, dtype=float)[:, :2]
+    return np.column_stack([ring[:-1], ring[1:]])  # x1, y1, x2, y2 (GeoJSON is lon, lat)
+
+def _inside(edges, x, y):
+    """Even-odd ray casting of points against every ring edge of a polygon.
+
+    Holes and multi-part polygons need no special casing: crossing a hole's
+    edge flips the point back to outside.
+    """
+    x1, y1, x2, y2 = edges.T
+    inside = np.empty(len(x), dtype=bool)
+    step = max(EDGE_BLOCK // max(len(edges), 1), 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for start in range(0, len(x), step):
+            px = x[start:start + step, None]
+            py = y[start:start + step, None]
+            spans = (y1 > py) != (y2 > py)
+            crossing_x = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+            inside[start:start + step] = np.count_nonzero(spans & (px < crossing_x), axis=1) % 2 == 1
+    return inside
+
+class BoundaryIndex:
+    """District polygons with bounding boxes, for locating many points at once.
+
+    Points are sorted by latitude, so the candidates for each polygon's
+    bounding box are a binary search plus a longitude mask; only those
+    candidates are ray-cast against the polygon's edges.
+    """
+
+    def __init__(self, features, province_field=PROVINCE_FIELD, district_field=DISTRICT_FIELD):
+        self.provinces = []
+        self.districts = []
+        self.edges = []
+        boxes = []
+        for feature in features:
+            geometry = feature.get("geometry") or {}
+            if geometry.get("type") == "Polygon":
+                polygons = [geometry["coordinates"]]
+            elif geometry.get("type") == "MultiPolygon":
+                polygons = geometry["coordinates"]
+            else:
+                continue
+            edges = np.concatenate([_ring_edges(ring) for polygon in polygons for ring in polygon])
+            self.edges.append(edges)
+            boxes.append((edges[:, 0].min(), edges[:, 1].min(), edges[:, 0].max(), edges[:, 1].max()))
+            self.provinces.append(feature["properties"].get(province_field))
+            self.districts.append(feature["properties"].get(district_field))
+        self.boxes = np.array(boxes, dtype=float).reshape(-1, 4)  # west, south, east, north
+
+    @classmethod
+    def from_geojson(cls, path, province_field=PROVINCE_FIELD, district_field=DISTRICT_FIELD):
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f)["features"], province_field, district_field)
+
+    def locate(self, lat, lon):
+        """Province and district names for each point (None outside every polygon)"""
+        lat = np.asarray(lat, dtype=float)
+        lon = np.asarray(lon, dtype=float)
+        province = np.full(len(lat), None, dtype=object)
+        district = np.full(len(lat), None, dtype=object)
+        unresolved = np.ones(len(lat), dtype=bool)
+
+        order = np.argsort(lat, kind="stable")
+        sorted_lat = lat[order]
+        for i, (west, south, east, north) in enumerate(self.boxes):
+            start = np.searchsorted(sorted_lat, south, side="left")
+            stop = np.searchsorted(sorted_lat, north, side="right")
+            candidates = order[start:stop]
+            candidates = candidates[unresolved[candidates] & (lon[candidates] >= west) & (lon[candidates] <= east)]
+            if not candidates.size:
+                continue
+            hits = candidates[_inside(self.edges[i], lon[candidates], lat[candidates])]
+            province[hits] = self.provinces[i]
+            district[hits] = self.districts[i]
+            unresolved[hits] = False
+        return province, district
+
+_index = None
+_index_lock = threading.Lock()
+
+def boundary_index():
+    """The index over BOUNDARIES_PATH, loaded once; None if the file is not installed"""
+    global _index
+    with _index_lock:
+        if _index is None or _index[0] != BOUNDARIES_PATH:
+            if os.path.exists(BOUNDARIES_PATH):
+                _index = (BOUNDARIES_PATH, BoundaryIndex.from_geojson(BOUNDARIES_PATH))
+            else:
+                logger.warning("No boundaries at %s; visits will not get a province or district", BOUNDARIES_PATH)
+                _index = (BOUNDARIES_PATH, None)
+        return _index[1]
+
+def locate(lat, lon):
+    """Province and district arrays for many points"""
+    index = boundary_index()
+    if index is None:
+        empty = np.full(len(np.atleast_1d(lat)), None, dtype=object)
+        return empty, empty.copy()
+    return index.locate(lat, lon)
+
+def geocode_table(only_missing=True, chunk_size=CHUNK_SIZE):
+    """Fill province and district on the locations table in chunks; returns rows located"""
+    located = 0
+    last_id = 0
+    where = "AND province IS NULL" if only_missing else ""
+    conn = connect()
+    try:
+        while True:
+            rows = conn.execute(
+                f"SELECT id, lat, lon FROM locations WHERE id > ? {where} ORDER BY id LIMIT ?",
+                (last_id, chunk_size)
+            ).fetchall()
+            if not rows:
+                break
+            ids, lat, lon = (np.array(column) for column in zip(*rows))
+            province, district = locate(lat, lon)
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "UPDATE locations SET province = ?, district = ? WHERE id = ?",
+                zip(province, district, ids.tolist())
+            )
+            conn.execute("COMMIT")
+            located += int(pd.notna(province).sum())
+            last_id = int(ids[-1])
+    finally:
+        conn.close()
+    return located
+
+def main(argv=None):
+    global BOUNDARIES_PATH
+    parser = argparse.ArgumentParser(description="Assign a province and district to every visit from local boundaries")
+    parser.add_argument("--db", default=locations_db.DB_NAME, help="SQLite database file")
+    parser.add_argument("--boundaries", default=BOUNDARIES_PATH, help="district boundaries GeoJSON")
+    parser.add_argument("--all", action="store_true", help="redo visits that already have a district")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="rows per transaction")
+    args = parser.parse_args(argv)
+
+    BOUNDARIES_PATH = args.boundaries
+    if boundary_index() is None:
+        print(f"Boundaries file not found: {args.boundaries}", file=sys.stderr)
+        return 1
+
+    locations_db.DB_NAME = args.db
+    init_db()
+    located = geocode_table(only_missing=not args.all, chunk_size=args.chunk_size)
+    print(f"Assigned a district to {located:,} visits")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
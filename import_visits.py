@@ -0,0 +1,136 @@
+import argparse
+import csv
+import json
+import math
+import os
+import sys
+from datetime import datetime
+from itertools import islice
+
+import locations_db
+from locations_db import LOCATION_COLUMNS, connect, init_db
+
+CHUNK_SIZE = 10000
+REQUIRED_FIELDS = ("name", "phone", "type", "lat", "lon", "timestamp")
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+def read_records(path, fmt):
+    """Stream visit records from a CSV or JSONL file as dicts"""
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def validate(record):
+    """Return a row tuple in LOCATION_COLUMNS order, or raise ValueError"""
+    for field in REQUIRED_FIELDS:
+        if record.get(field) in (None, ""):
+            raise ValueError(f"missing {field}")
+
+    lat, lon = float(record["lat"]), float(record["lon"])
+    if not (math.isfinite(lat) and -90 <= lat <= 90):
+        raise ValueError(f"lat out of range: {record['lat']}")
+    if not (math.isfinite(lon) and -180 <= lon <= 180):
+        raise ValueError(f"lon out of range: {record['lon']}")
+    datetime.strptime(str(record["timestamp"]), TIMESTAMP_FORMAT)
+
+    row = {column: record.get(column) or None for column in LOCATION_COLUMNS}
+    row.update(lat=lat, lon=lon)
+    return tuple(row[column] for column in LOCATION_COLUMNS)
+
+def import_file(path, fmt, chunk_size=CHUNK_SIZE, restart=False, rejects=None):
+    """Load a visit file into locations in chunks, resuming where a previous run stopped"""
+    source = os.path.abspath(path)
+    insert_sql = f"""
+        INSERT INTO locations ({', '.join(LOCATION_COLUMNS)})
+        VALUES ({', '.join('?' * len(LOCATION_COLUMNS))})
+    """
+
+    conn = connect()
+    try:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS import_progress (
+                source TEXT PRIMARY KEY,
+                records_done INTEGER NOT NULL,
+                rows_inserted INTEGER NOT NULL,
+                rows_rejected INTEGER NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+        """)
+        if restart:
+            conn.execute("DELETE FROM import_progress WHERE source = ?", (source,))
+
+        progress = conn.execute(
+            "SELECT records_done, rows_inserted, rows_rejected FROM import_progress WHERE source = ?",
+            (source,)
+        ).fetchone()
+        done, inserted, rejected = progress or (0, 0, 0)
+        if done:
+            print(f"Resuming {path} after {done:,} records")
+
+        records = islice(read_records(path, fmt), done, None)
+        while True:
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                break
+
+            rows = []
+            for offset, record in enumerate(chunk, start=done + 1):
+                try:
+                    rows.append(validate(record))
+                except (ValueError, TypeError) as e:
+                    rejected += 1
+                    if rejects:
+                        rejects.write(json.dumps({"record": offset, "error": str(e), "data": record}) + "\n")
+
+            # Rows and the checkpoint commit together, so a crash never double-loads a chunk
+            done += len(chunk)
+            inserted += len(rows)
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(insert_sql, rows)
+                conn.execute("""
+                    INSERT OR REPLACE INTO import_progress
+                    (source, records_done, rows_inserted, rows_rejected, updated_at)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (source, done, inserted, rejected, datetime.now().strftime(TIMESTAMP_FORMAT)))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            print(f"{done:,} records read, {inserted:,} inserted, {rejected:,} rejected")
+    finally:
+        conn.close()
+
+    return inserted, rejected
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import historical visits into the locations table")
+    parser.add_argument("path", help="CSV or JSONL file of visit records")
+    parser.add_argument("--format", choices=["csv", "jsonl"],
+                        help="input format (default: from the file extension)")
+    parser.add_argument("--db", default=locations_db.DB_NAME, help="SQLite database file")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="records per transaction")
+    parser.add_argument("--restart", action="store_true", help="ignore any saved progress for this file")
+    parser.add_argument("--rejects", help="write invalid records with their errors to this JSONL file")
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ("csv" if args.path.lower().endswith(".csv") else "jsonl")
+    locations_db.DB_NAME = args.db
+    init_db()
+
+    rejects = open(args.rejects, "a", encoding="utf-8") if args.rejects else None
+    try:
+        inserted, rejected = import_file(args.path, fmt, args.chunk_size, args.restart, rejects)
+    finally:
+        if rejects:
+            rejects.close()
+
+    print(f"Done: {inserted:,} rows inserted, {rejected:,} rejected")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,106 +1,95 @@
 import streamlit as st
 from streamlit_javascript import st_javascript
-from streamlit_folium import st_folium
+from streamlit_folium import generate_leaflet_string, st_folium
 import folium
-from datetime import datetime
+from datetime import datetime, timedelta
 import sqlite3
-import pandas as pd
-import base64
 import os
-from PIL import Image
-import io
+import math
+from customer_images import get_thumbnail, save_image
+from locations_db import (
+    customers_within, init_db, load_from_db, load_in_bounds, nearest_customers,
+    network_extent, region_counts, visit_summary
+)
+from dedupe import find_duplicates
+from geocode import boundary_index
+from exporter import EXPORT_FORMATS, export_bytes, write_query
+from map_layers import ColumnarMarkerLayer, build_heat_pyramid, heat_cells, lookup, route_layer, use_bulk_markers
+from routing import plan_route
+from submission_queue import pending_visits, resume_flusher, submit_visit
+from timing import start_rerun
 
 # Configuration
-DB_NAME = "customer_locations.db"
-IMAGE_DIR = "customer_images"
-os.makedirs(IMAGE_DIR, exist_ok=True)
-
-def init_db():
-    """Initialize database with proper schema"""
-    with sqlite3.connect(DB_NAME) as conn:
-        c = conn.cursor()
-        c.execute("""
-            CREATE TABLE IF NOT EXISTS locations (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                phone TEXT NOT NULL,
-                type TEXT NOT NULL,
-                address TEXT,
-                lat REAL NOT NULL,
-                lon REAL NOT NULL,
-                notes TEXT,
-                image_path TEXT,
-                timestamp TEXT NOT NULL
-            )
-        """)
-        conn.commit()
+NEARBY_RADIUS_KM = 1
+NEAREST_COUNT = 5
+ROUTE_RADIUS_KM = 5
+MAX_ROUTE_STOPS = 300
 
-def save_image(uploaded_file):
-    """Save uploaded image to disk and return path"""
-    if not uploaded_file:
-        return None
-        
-    # Generate unique filename
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    ext = uploaded_file.name.split('.')[-1]
-    filename = f"{timestamp}.{ext}"
-    filepath = os.path.join(IMAGE_DIR, filename)
-    
-    # Save the file
-    with open(filepath, "wb") as f:
-        f.write(uploaded_file.getbuffer())
-        
-    return filepath
+@st.cache_resource
+def _init_db_once():
+    """Create or migrate the schema once per server process"""
+    init_db()
 
 def save_to_db(data):
-    """Save customer data to database"""
+    """Queue customer data for the database; it is safe on disk once this returns"""
     try:
-        with sqlite3.connect(DB_NAME) as conn:
-            c = conn.cursor()
-            c.execute("""
-                INSERT INTO locations 
-                (name, phone, type, address, lat, lon, notes, image_path, timestamp)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                data['name'], data['phone'], data['type'],
-                data['address'], data['lat'], data['lon'],
-                data['notes'], data.get('image_path'), data['timestamp']
-            ))
-            conn.commit()
-            return True
+        submit_visit(data)
     except sqlite3.Error as e:
         st.error(f"Database error: {str(e)}")
         return False
+    return True
 
-def load_from_db():
-    """Load all customer data from database"""
-    with sqlite3.connect(DB_NAME) as conn:
-        conn.row_factory = sqlite3.Row
-        c = conn.cursor()
-        c.execute("SELECT * FROM locations")
-        rows = c.fetchall()
-        return pd.DataFrame([dict(row) for row in rows])
-
-def get_image_html(image_path):
-    """Generate HTML for image preview in popup"""
-    if not image_path or not os.path.exists(image_path):
-        return '<p><i>No image available</i></p>'
-    
+@st.cache_resource(max_entries=2)
+def heatmap_pyramid(version, _data):
+    """Pre-binned heatmap cells for one version (row count, last row id) of the table"""
+    return build_heat_pyramid(_data['lat'].to_numpy(), _data['lon'].to_numpy())
+
+def bounds_from_folium(bounds):
+    """Convert st_folium's bounds dict into a (south, west, north, east) tuple"""
     try:
-        # Create thumbnail
-        img = Image.open(image_path)
-        img.thumbnail((200, 200))
-        buffered = io.BytesIO()
-        img.save(buffered, format="JPEG" if image_path.lower().endswith('.jpg') else "PNG")
-        encoded = base64.b64encode(buffered.getvalue()).decode('utf-8')
-        return f'<img src="data:image/jpeg;base64,{encoded}" style="width: 100%; height: auto; border-radius: 8px; margin-bottom: 5px;" />'
-    except Exception as e:
-        st.warning(f"Couldn't load image: {str(e)}")
-        return '<p><i>Image unavailable</i></p>'
+        south_west, north_east = bounds["_southWest"], bounds["_northEast"]
+        return (south_west["lat"], south_west["lng"], north_east["lat"], north_east["lng"])
+    except (KeyError, TypeError):
+        return None
+
+def estimate_bounds(lat, lon, zoom, width, height):
+    """Approximate the visible bounds of a web-mercator map before it is drawn"""
+    deg_per_px = 360 / (256 * 2 ** zoom)
+    half_lon = deg_per_px * width / 2
+    half_lat = deg_per_px * height / 2 * math.cos(math.radians(lat))
+    return (lat - half_lat, lon - half_lon, lat + half_lat, lon + half_lon)
+
+def show_visit_details(rows):
+    """Show the details and thumbnail of the customers under a clicked marker"""
+    for _, row in rows.iterrows():
+        col1, col2 = st.columns([1, 4])
+        with col1:
+            try:
+                # Prefer the derivative made at upload; older rows get one on demand
+                thumb_path = row.get('thumb_path')
+                if not (isinstance(thumb_path, str) and os.path.exists(thumb_path)):
+                    thumb_path = get_thumbnail(row.get('image_path'))
+            except Exception as e:
+                st.warning(f"Couldn't load image: {str(e)}")
+                thumb_path = None
+            if thumb_path:
+                st.image(thumb_path, width=200)
+            else:
+                st.caption("No image available")
+        with col2:
+            st.markdown(f"#### {row['name']}")
+            st.write(f"**Type:** {row['type']}")
+            st.write(f"**Phone:** {row['phone']}")
+            st.write(f"**Last visit:** {row['timestamp']}")
+            if row['notes']:
+                st.write(f"*{row['notes']}*")
 
 # Streamlit App
 st.set_page_config(page_title="Customer Network Builder", layout="wide")
 st.title("🏢 Customer Network Builder")
+_init_db_once()
+resume_flusher()  # flush anything left queued from before a restart
+timings = start_rerun("latlong")
 
 # Step 1: Get GPS
 with st.expander("📍 Step 1: Capture Current Location", expanded=False):
@@ -127,6 +116,25 @@ with st.expander("📍 Step 1: Capture Current Location", expanded=False):
             icon=folium.Icon(color="blue", icon="user")
         ).add_to(m_current)
         st_folium(m_current, width=1900, height=800)
+
+        # Customers around the rep, straight from the R*Tree index
+        with timings.span("nearby customers") as span:
+            nearby = customers_within(lat, lon, NEARBY_RADIUS_KM)
+            span['rows'] = len(nearby)
+        if not nearby.empty:
+            st.caption(f"{len(nearby)} customers within {NEARBY_RADIUS_KM:g} km")
+        else:
+            with timings.span("nearest customers") as span:
+                nearby = nearest_customers(lat, lon, k=NEAREST_COUNT)
+                span['rows'] = len(nearby)
+            if not nearby.empty:
+                st.caption(f"No customers within {NEARBY_RADIUS_KM:g} km; nearest {len(nearby)} shown")
+        if not nearby.empty:
+            st.dataframe(
+                nearby[['name', 'type', 'phone', 'address', 'distance_km']],
+                hide_index=True,
+                column_config={'distance_km': st.column_config.NumberColumn("Distance (km)", format="%.2f")}
+            )
     else:
         st.warning("Please enable GPS permissions in your browser to continue")
         st.stop()
@@ -155,10 +163,10 @@ with st.expander("📝 Step 2: Customer Information", expanded=True):
             if not name or not phone:
                 st.error("Please fill in all required fields (*)")
             else:
-                # Save image and get path
-                image_path = save_image(image_file) if image_file else None
-                
-                if save_to_db({
+                # Queue the image for storage and get its paths
+                with timings.span("image queue"):
+                    image_paths = save_image(image_file) or {}
+                record = {
                     'name': name,
                     'phone': phone,
                     'type': cust_type,
@@ -166,24 +174,65 @@ with st.expander("📝 Step 2: Customer Information", expanded=True):
                     'lat': lat,
                     'lon': lon,
                     'notes': notes,
-                    'image_path': image_path,
+                    **image_paths,
                     'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                }):
+                }
+                with timings.span("duplicate check"):
+                    duplicates = find_duplicates(record)
+                with timings.span("queue write"):
+                    saved = save_to_db(record)
+                
+                if saved:
                     st.success("Customer saved successfully!")
-                    st.balloons()
+                    pending = pending_visits()
+                    if pending > 1:
+                        st.caption(f"{pending} saved visits are still being added to the map")
+                    if not duplicates.empty:
+                        matches = ", ".join(
+                            f"{row.name} ({row.phone}, {row.distance_km * 1000:.0f} m away)"
+                            for row in duplicates.head(3).itertuples()
+                        )
+                        st.warning(f"⚠️ This may be an existing customer: {matches}")
+                    else:
+                        st.balloons()
                 else:
                     st.error("Failed to save customer data")
 
 # Step 3: Customer Map View
 st.subheader("🗺️ Customer Network Map")
-data = load_from_db()
+with timings.span("network extent"):
+    count, avg_lat, avg_lon = network_extent()
+
+if count:
+    # Headline numbers from the per-type/day summary table, never a scan of the visits
+    with timings.span("summary"):
+        summary = visit_summary()
+    today = datetime.now()
+    week_start = (today - timedelta(days=6)).strftime("%Y-%m-%d")
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Total Visits", f"{count:,}")
+    col2.metric("Visits Today", f"{summary.loc[summary['day'] == today.strftime('%Y-%m-%d'), 'visits'].sum():,}")
+    col3.metric("Last 7 Days", f"{summary.loc[summary['day'] >= week_start, 'visits'].sum():,}")
+    col4.metric("VIP Visits", f"{summary.loc[summary['type'] == 'VIP', 'visits'].sum():,}")
+
+    # Visits only have a province and district once the boundaries file is installed
+    if boundary_index() is not None:
+        with timings.span("regions"):
+            regions = region_counts()
+        if not regions.empty:
+            with st.expander("📊 Visits by Province and District"):
+                st.dataframe(regions.sort_values('visits', ascending=False), hide_index=True)
+
+    # Only fetch the customers inside the area the map is currently showing
+    map_state = st.session_state.get("network_map") or {}
+    bounds = bounds_from_folium(map_state.get("bounds")) or estimate_bounds(avg_lat, avg_lon, 15, 1900, 800)
+    with timings.span("sqlite read") as span:
+        data = load_in_bounds(*bounds)
+        span['rows'] = len(data)
 
-if not data.empty:
     # Create map centered on average of all points
-    avg_lat = data['lat'].mean()
-    avg_lon = data['lon'].mean()
-    
     m_all = folium.Map(location=[avg_lat, avg_lon], zoom_start=15, tiles='OpenStreetMap')
+    customers_layer = folium.FeatureGroup(name="Customers")
     
     # Configure marker colors
     type_colors = {
@@ -193,33 +242,94 @@ if not data.empty:
         "Repeat": "blue"
     }
     
-    # Add markers
-    for _, row in data.iterrows():
-        popup_html = f"""
-            <div style="width: 250px;">
-                {get_image_html(row.get('image_path'))}
-                <h4 style="margin: 0;">{row['name']}</h4>
-                <p style="margin: 5px 0;">
-                    <b>Type:</b> {row['type']}<br>
-                    <b>Phone:</b> {row['phone']}<br>
-                    <b>Last visit:</b> {row['timestamp']}<br>
-                    <i>{row['notes']}</i>
-                </p>
-            </div>
-        """
+    with timings.span("map build") as span:
+        colors = lookup(data['type'], type_colors, "gray")
 
-        folium.Marker(
-            [row["lat"], row["lon"]],
-            popup=folium.Popup(popup_html, max_width=300),
-            tooltip=row['name'],
-            icon=folium.Icon(color=type_colors.get(row['type'], "gray"))
-        ).add_to(m_all)
+        # Markers carry only a tooltip; details and thumbnails load when one is clicked
+        if use_bulk_markers(data):
+            # Many points: one clustered layer built straight from the columns
+            ColumnarMarkerLayer(
+                data['lat'], data['lon'], colors,
+                tooltip=data['name'], name="Customers"
+            ).add_to(customers_layer)
+        else:
+            # Add markers
+            for marker_lat, marker_lon, name, color in zip(data['lat'], data['lon'], data['name'], colors):
+                folium.Marker(
+                    [marker_lat, marker_lon],
+                    tooltip=name,
+                    icon=folium.Icon(color=color)
+                ).add_to(customers_layer)
+        span['markers'] = len(data)
 
-    # Add heatmap
+    # Add heatmap from the pre-binned cells visible at the current zoom
     from folium.plugins import HeatMap
-    heat_data = [[row['lat'], row['lon']] for _, row in data.iterrows()]
-    HeatMap(heat_data, radius=15).add_to(m_all)
+    with timings.span("heatmap") as span:
+        network = load_from_db()
+        # Archiving removes rows without changing the last id, so the count is part of the version
+        pyramid = heatmap_pyramid((len(network), int(network['id'].iloc[-1])), network)
+        heat_data = heat_cells(pyramid, map_state.get("zoom", 15), bounds)
+        span['cells'] = len(heat_data)
+    if heat_data:
+        HeatMap(heat_data, radius=15).add_to(customers_layer)
     
-    st_folium(m_all, width=1900, height=800)
+    # Markers go in as a dynamic layer so panning does not remount the map
+    with timings.span("st_folium") as span:
+        map_state = st_folium(m_all, width=1900, height=800, key="network_map",
+                              feature_group_to_add=customers_layer,
+                              returned_objects=["bounds", "zoom", "last_object_clicked"])
+    if timings.sampled:
+        # Size of the map and markers scripts sent to the browser, measured outside the span
+        span['payload_bytes'] = (len(generate_leaflet_string(m_all))
+                                 + len(generate_leaflet_string(customers_layer, base_id="feature_group_0")))
+
+    clicked = map_state.get("last_object_clicked") if map_state else None
+    if clicked:
+        selected = data[(data['lat'] == clicked['lat']) & (data['lon'] == clicked['lng'])]
+        if not selected.empty:
+            st.subheader("📋 Selected Customer")
+            with timings.span("visit details"):
+                show_visit_details(selected)
+
+    # Export the whole visits table, streamed from SQLite only when clicked
+    format_col, export_col = st.columns([1, 3])
+    export_format = format_col.selectbox("Export format", list(EXPORT_FORMATS))
+    extension, mime = EXPORT_FORMATS[export_format]
+    export_col.download_button(
+        label="📥 Export All Visits",
+        data=lambda: export_bytes(write_query, "SELECT * FROM locations ORDER BY id", fmt=export_format),
+        file_name=f"customer_visits_{datetime.now().strftime('%Y%m%d')}{extension}",
+        mime=mime
+    )
 else:
     st.info("No customers in your network yet. Start by adding your first customer above.")
+
+# Step 4: Route through the customers around the rep
+if count and st.toggle("🧭 Plan a route from my location"):
+    route_radius = st.slider("Include customers within (km)", 1, 50, ROUTE_RADIUS_KM)
+    stops = customers_within(lat, lon, route_radius).head(MAX_ROUTE_STOPS)
+    if stops.empty:
+        st.info(f"No customers within {route_radius} km")
+    else:
+        with timings.span("route") as span:
+            order, km = plan_route(stops['lat'], stops['lon'], start=(lat, lon))
+            route = stops.iloc[order]
+            span['stops'] = len(route)
+        st.caption(f"{len(route)} stops, {km:,.1f} km from your location")
+
+        m_route = folium.Map(location=[lat, lon], zoom_start=14)
+        route_layer(route['lat'], route['lon'], route['name'], start=(lat, lon)).add_to(m_route)
+        m_route.fit_bounds([[min(lat, route['lat'].min()), min(lon, route['lon'].min())],
+                            [max(lat, route['lat'].max()), max(lon, route['lon'].max())]])
+        with timings.span("route map") as span:
+            st_folium(m_route, width=1900, height=600, key="route_map", returned_objects=[])
+        if timings.sampled:
+            span['payload_bytes'] = len(generate_leaflet_string(m_route))
+        st.dataframe(
+            route[['name', 'type', 'phone', 'address', 'distance_km']].assign(stop=range(1, len(route) + 1)),
+            hide_index=True,
+            column_order=['stop', 'name', 'type', 'phone', 'address', 'distance_km'],
+            column_config={'distance_km': st.column_config.NumberColumn("From you (km)", format="%.2f")}
+        )
+
+timings.finish()
@@ -0,0 +1,103 @@
+import argparse
+import os
+import sys
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.impute import SimpleImputer
+from sklearn.pipeline import Pipeline, make_pipeline
+from sklearn.preprocessing import OrdinalEncoder
+
+# Configuration
+TRAIN_PATH = "train.csv"
+MODEL_PATH = "loan_model.joblib"
+CHUNK_SIZE = 100000
+
+# Same preparation as loan_approval.ipynb: mode-fill and label-encode these...
+CATEGORICAL = ["Gender", "Married", "Dependents", "Education", "Self_Employed", "Property_Area"]
+# ...and mean-fill these
+NUMERIC = ["ApplicantIncome", "CoapplicantIncome", "LoanAmount", "Loan_Amount_Term", "Credit_History"]
+TARGET = "Loan_Status"
+
+def _features(data):
+    """Select the model columns in a fixed order; any missing column becomes all-NaN"""
+    features = data.reindex(columns=CATEGORICAL + NUMERIC)
+    features[CATEGORICAL] = features[CATEGORICAL].astype(object).where(features[CATEGORICAL].notna(), np.nan)
+    features[NUMERIC] = features[NUMERIC].apply(pd.to_numeric, errors="coerce")
+    return features
+
+def build_pipeline():
+    """Imputation, label encoding and classifier as one fitted-together pipeline"""
+    preprocess = ColumnTransformer([
+        ("categorical", make_pipeline(
+            SimpleImputer(strategy="most_frequent"),
+            OrdinalEncoder(handle_unknown="use_encoded_value", unknown_value=-1),
+        ), CATEGORICAL),
+        ("numeric", SimpleImputer(strategy="mean"), NUMERIC),
+    ])
+    model = RandomForestClassifier(n_estimators=300, min_samples_leaf=3, random_state=42, n_jobs=-1)
+    return Pipeline([("preprocess", preprocess), ("model", model)])
+
+def train(path=TRAIN_PATH):
+    """Fit the pipeline on a training CSV with a Y/N Loan_Status column"""
+    data = pd.read_csv(path)
+    pipeline = build_pipeline()
+    pipeline.fit(_features(data), data[TARGET].eq("Y").astype(int))
+    return pipeline
+
+def save_model(pipeline, path=MODEL_PATH):
+    """Persist a fitted pipeline"""
+    joblib.dump(pipeline, path)
+
+def load_model(path=MODEL_PATH, train_path=TRAIN_PATH):
+    """Load the persisted pipeline, training and saving it first if it does not exist"""
+    if not os.path.exists(path):
+        save_model(train(train_path), path)
+    return joblib.load(path)
+
+def score_frame(pipeline, data, chunk_size=CHUNK_SIZE):
+    """Probability of approval for every row, predicted in chunks"""
+    features = _features(data)
+    scores = [
+        pipeline.predict_proba(features.iloc[start:start + chunk_size])[:, 1]
+        for start in range(0, len(features), chunk_size)
+    ]
+    return np.concatenate(scores) if scores else np.empty(0)
+
+def score_csv(pipeline, src, dst, chunk_size=CHUNK_SIZE):
+    """Stream a CSV of applications through the model, writing an Approval_Probability column"""
+    rows = 0
+    for i, chunk in enumerate(pd.read_csv(src, chunksize=chunk_size)):
+        chunk["Approval_Probability"] = score_frame(pipeline, chunk, chunk_size)
+        chunk.to_csv(dst, mode="w" if i == 0 else "a", header=i == 0, index=False)
+        rows += len(chunk)
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the loan approval model or batch-score applications")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    train_cmd = commands.add_parser("train", help="fit the model and save it")
+    train_cmd.add_argument("--data", default=TRAIN_PATH, help="training CSV")
+    train_cmd.add_argument("--model", default=MODEL_PATH, help="where to save the fitted pipeline")
+
+    score_cmd = commands.add_parser("score", help="score a CSV of applications")
+    score_cmd.add_argument("src", help="input CSV (same columns as test.csv)")
+    score_cmd.add_argument("dst", help="output CSV")
+    score_cmd.add_argument("--model", default=MODEL_PATH, help="fitted pipeline to use")
+    score_cmd.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="rows per batch")
+    args = parser.parse_args(argv)
+
+    if args.command == "train":
+        save_model(train(args.data), args.model)
+        print(f"Saved model to {args.model}")
+    else:
+        rows = score_csv(load_model(args.model), args.src, args.dst, args.chunk_size)
+        print(f"Scored {rows:,} rows into {args.dst}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,370 @@
+import calendar
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from geo import bbox_around, haversine_km
+
+# Configuration
+DB_NAME = "customer_locations.db"
+READER_POOL_SIZE = 8
+NEAREST_START_KM = 0.5
+NEAREST_MAX_KM = 50
+
+# Applied to every connection; journal_mode=WAL lets readers run alongside the writer
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA cache_size = -20000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA mmap_size = 268435456",
+)
+
+# Indexed seconds-since-1970 of the TEXT timestamp (a local time, read as if it were UTC)
+VISITED_AT = "CAST(strftime('%s', timestamp) AS INTEGER)"
+
+LOCATION_COLUMNS = (
+    "name", "phone", "type", "address", "lat", "lon", "notes",
+    "image_path", "display_path", "thumb_path", "province", "district", "timestamp",
+)
+
+def connect(readonly=False):
+    """Open a tuned connection to DB_NAME in autocommit mode"""
+    conn = sqlite3.connect(DB_NAME, check_same_thread=False, isolation_level=None)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    if readonly:
+        conn.execute("PRAGMA query_only = 1")
+    return conn
+
+def init_db():
+    """Initialize database with proper schema"""
+    conn = connect()
+    try:
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS locations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                phone TEXT NOT NULL,
+                type TEXT NOT NULL,
+                address TEXT,
+                lat REAL NOT NULL,
+                lon REAL NOT NULL,
+                notes TEXT,
+                image_path TEXT,
+                display_path TEXT,
+                thumb_path TEXT,
+                province TEXT,
+                district TEXT,
+                timestamp TEXT NOT NULL,
+                submission_id TEXT,
+                visited_at INTEGER GENERATED ALWAYS AS ({VISITED_AT}) VIRTUAL
+            )
+        """.format(VISITED_AT=VISITED_AT))
+
+        # Bring older databases up to the current set of columns
+        c.execute("PRAGMA table_info(locations)")
+        existing = {row[1] for row in c.fetchall()}
+        for column in ("image_path", "display_path", "thumb_path", "province", "district", "submission_id"):
+            if column not in existing:
+                c.execute(f"ALTER TABLE locations ADD COLUMN {column} TEXT")
+        c.execute("PRAGMA table_xinfo(locations)")
+        if "visited_at" not in {row[1] for row in c.fetchall()}:
+            c.execute(f"ALTER TABLE locations ADD COLUMN visited_at INTEGER GENERATED ALWAYS AS ({VISITED_AT}) VIRTUAL")
+        c.execute("CREATE INDEX IF NOT EXISTS locations_region ON locations (province, district)")
+        c.execute("CREATE INDEX IF NOT EXISTS locations_visited_at ON locations (visited_at)")
+        c.execute("CREATE INDEX IF NOT EXISTS locations_phone_visited_at ON locations (phone, visited_at)")
+        # Idempotency key of visits that came through the submission queue
+        c.execute("CREATE UNIQUE INDEX IF NOT EXISTS locations_submission_id ON locations (submission_id)")
+
+        # Cold storage for old visits, and a log of archive runs that tells caches to reload
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS locations_archive (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                phone TEXT NOT NULL,
+                type TEXT NOT NULL,
+                address TEXT,
+                lat REAL NOT NULL,
+                lon REAL NOT NULL,
+                notes TEXT,
+                image_path TEXT,
+                display_path TEXT,
+                thumb_path TEXT,
+                province TEXT,
+                district TEXT,
+                timestamp TEXT NOT NULL,
+                visited_at INTEGER,
+                submission_id TEXT
+            )
+        """)
+        c.execute("PRAGMA table_info(locations_archive)")
+        if "submission_id" not in {row[1] for row in c.fetchall()}:
+            c.execute("ALTER TABLE locations_archive ADD COLUMN submission_id TEXT")
+        # Keeps archived submissions from being inserted again if they are replayed
+        c.execute("CREATE INDEX IF NOT EXISTS locations_archive_submission_id ON locations_archive (submission_id)")
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS archive_runs (
+                id INTEGER PRIMARY KEY,
+                archived_at TEXT NOT NULL,
+                cutoff TEXT NOT NULL,
+                visits INTEGER NOT NULL
+            )
+        """)
+
+        # R*Tree side table over lat/lon, kept in step with locations by triggers
+        c.execute("SELECT 1 FROM sqlite_master WHERE name = 'locations_rtree'")
+        if c.fetchone() is None:
+            c.execute("""
+                CREATE VIRTUAL TABLE locations_rtree USING rtree(
+                    id, min_lat, max_lat, min_lon, max_lon
+                )
+            """)
+            c.execute("""
+                INSERT INTO locations_rtree
+                SELECT id, lat, lat, lon, lon FROM locations
+            """)
+        c.execute("""
+            CREATE TRIGGER IF NOT EXISTS locations_rtree_insert
+            AFTER INSERT ON locations BEGIN
+                INSERT INTO locations_rtree VALUES (NEW.id, NEW.lat, NEW.lat, NEW.lon, NEW.lon);
+            END
+        """)
+        c.execute("""
+            CREATE TRIGGER IF NOT EXISTS locations_rtree_update
+            AFTER UPDATE OF lat, lon ON locations BEGIN
+                UPDATE locations_rtree
+                SET min_lat = NEW.lat, max_lat = NEW.lat, min_lon = NEW.lon, max_lon = NEW.lon
+                WHERE id = NEW.id;
+            END
+        """)
+        c.execute("""
+            CREATE TRIGGER IF NOT EXISTS locations_rtree_delete
+            AFTER DELETE ON locations BEGIN
+                DELETE FROM locations_rtree WHERE id = OLD.id;
+            END
+        """)
+
+        # Visit counts and coordinate sums per type and day, also kept up to date by triggers
+        c.execute("SELECT 1 FROM sqlite_master WHERE name = 'visit_summary'")
+        if c.fetchone() is None:
+            c.execute("""
+                CREATE TABLE visit_summary (
+                    type TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    visits INTEGER NOT NULL,
+                    lat_sum REAL NOT NULL,
+                    lon_sum REAL NOT NULL,
+                    PRIMARY KEY (type, day)
+                ) WITHOUT ROWID
+            """)
+            c.execute("""
+                INSERT INTO visit_summary
+                SELECT type, substr(timestamp, 1, 10), COUNT(*), SUM(lat), SUM(lon)
+                FROM locations GROUP BY 1, 2
+            """)
+        c.execute("""
+            CREATE TRIGGER IF NOT EXISTS visit_summary_insert
+            AFTER INSERT ON locations BEGIN
+                INSERT INTO visit_summary VALUES (NEW.type, substr(NEW.timestamp, 1, 10), 1, NEW.lat, NEW.lon)
+                ON CONFLICT (type, day) DO UPDATE SET
+                    visits = visits + 1, lat_sum = lat_sum + NEW.lat, lon_sum = lon_sum + NEW.lon;
+            END
+        """)
+        c.execute("""
+            CREATE TRIGGER IF NOT EXISTS visit_summary_update
+            AFTER UPDATE OF type, timestamp, lat, lon ON locations BEGIN
+                UPDATE visit_summary
+                SET visits = visits - 1, lat_sum = lat_sum - OLD.lat, lon_sum = lon_sum - OLD.lon
+                WHERE type = OLD.type AND day = substr(OLD.timestamp, 1, 10);
+                DELETE FROM visit_summary
+                WHERE type = OLD.type AND day = substr(OLD.timestamp, 1, 10) AND visits = 0;
+                INSERT INTO visit_summary VALUES (NEW.type, substr(NEW.timestamp, 1, 10), 1, NEW.lat, NEW.lon)
+                ON CONFLICT (type, day) DO UPDATE SET
+                    visits = visits + 1, lat_sum = lat_sum + NEW.lat, lon_sum = lon_sum + NEW.lon;
+            END
+        """)
+        c.execute("""
+            CREATE TRIGGER IF NOT EXISTS visit_summary_delete
+            AFTER DELETE ON locations BEGIN
+                UPDATE visit_summary
+                SET visits = visits - 1, lat_sum = lat_sum - OLD.lat, lon_sum = lon_sum - OLD.lon
+                WHERE type = OLD.type AND day = substr(OLD.timestamp, 1, 10);
+                DELETE FROM visit_summary
+                WHERE type = OLD.type AND day = substr(OLD.timestamp, 1, 10) AND visits = 0;
+            END
+        """)
+        c.execute("COMMIT")
+    finally:
+        conn.close()
+
+# --- Readers ---
+_readers = queue.LifoQueue()
+
+@contextmanager
+def reader():
+    """Borrow a read-only connection from the process-wide pool"""
+    conn = None
+    while conn is None:
+        try:
+            db, conn = _readers.get_nowait()
+        except queue.Empty:
+            db, conn = DB_NAME, connect(readonly=True)
+        if db != DB_NAME:  # pooled before DB_NAME was pointed elsewhere
+            conn.close()
+            conn = None
+    try:
+        yield conn
+    finally:
+        if _readers.qsize() < READER_POOL_SIZE:
+            _readers.put((db, conn))
+        else:
+            conn.close()
+
+def query_frame(sql, params=()):
+    """Run a SELECT on a pooled reader and build a DataFrame from the rows"""
+    with reader() as conn:
+        c = conn.execute(sql, params)
+        columns = [d[0] for d in c.description]
+        return pd.DataFrame.from_records(c.fetchall(), columns=columns)
+
+def query_one(sql, params=()):
+    """Run a SELECT on a pooled reader and return its first row"""
+    with reader() as conn:
+        return conn.execute(sql, params).fetchone()
+
+# --- Queries ---
+# Process-wide column store of the locations table, shared by all sessions
+_location_cache = {"lock": threading.Lock(), "db": None, "archive_run": None, "last_id": 0, "frame": None}
+
+def invalidate_location_cache():
+    """Drop the cached table so the next load re-reads it from scratch"""
+    with _location_cache["lock"]:
+        _location_cache.update(db=None, archive_run=None, last_id=0, frame=None)
+
+def load_from_db():
+    """Load all customer data, fetching only rows added since the last call"""
+    cache = _location_cache
+    with cache["lock"]:
+        with reader() as conn:
+            # Archiving deletes rows, so it is the one change that needs a full reload
+            archive_run = conn.execute("SELECT COALESCE(MAX(id), 0) FROM archive_runs").fetchone()[0]
+            if cache["db"] != DB_NAME or cache["archive_run"] != archive_run:
+                cache.update(db=DB_NAME, archive_run=archive_run, last_id=0, frame=None)
+            c = conn.execute("SELECT * FROM locations WHERE id > ? ORDER BY id", (cache["last_id"],))
+            columns = [d[0] for d in c.description]
+            rows = c.fetchall()
+
+        if cache["frame"] is None:
+            cache["frame"] = pd.DataFrame.from_records(rows, columns=columns)
+        elif rows:
+            new_rows = pd.DataFrame.from_records(rows, columns=columns)
+            cache["frame"] = pd.concat([cache["frame"], new_rows], ignore_index=True)
+
+        if rows:
+            cache["last_id"] = rows[-1][columns.index("id")]
+        return cache["frame"]
+
+def load_in_bounds(south, west, north, east):
+    """Load only the customers inside a lat/lon bounding box"""
+    return query_frame("""
+        SELECT l.* FROM locations_rtree AS r
+        JOIN locations AS l ON l.id = r.id
+        WHERE r.max_lat >= ? AND r.min_lat <= ?
+          AND r.max_lon >= ? AND r.min_lon <= ?
+    """, (south, north, west, east))
+
+def region_counts():
+    """Number of visits per province and district, answered from the region index"""
+    return query_frame("""
+        SELECT province, district, COUNT(*) AS visits FROM locations
+        WHERE province IS NOT NULL
+        GROUP BY province, district
+    """)
+
+def to_epoch(when):
+    """A naive datetime in the same seconds-since-1970 scale as visited_at"""
+    return calendar.timegm(when.timetuple())
+
+def visits_between(start, end=None):
+    """Visits from start up to (not including) end, oldest first, via the visited_at index"""
+    if end is None:
+        return query_frame("SELECT * FROM locations WHERE visited_at >= ? ORDER BY visited_at", (to_epoch(start),))
+    return query_frame(
+        "SELECT * FROM locations WHERE visited_at >= ? AND visited_at < ? ORDER BY visited_at",
+        (to_epoch(start), to_epoch(end))
+    )
+
+def recent_visits(days):
+    """Visits in the last `days` days"""
+    return visits_between(datetime.now() - timedelta(days=days))
+
+def stale_customers(days):
+    """Customers, by phone, whose latest visit is more than `days` days ago"""
+    return query_frame("""
+        SELECT phone, name, type, timestamp AS last_visit, MAX(visited_at) AS last_visited_at
+        FROM locations
+        GROUP BY phone
+        HAVING last_visited_at < ?
+        ORDER BY last_visited_at
+    """, (to_epoch(datetime.now() - timedelta(days=days)),))
+
+def archive_visits(before):
+    """Move visits older than `before` into locations_archive; returns how many moved"""
+    cutoff = to_epoch(before)
+    columns = ", ".join(("id",) + LOCATION_COLUMNS + ("visited_at", "submission_id"))
+    conn = connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        moved = conn.execute(f"""
+            INSERT INTO locations_archive ({columns})
+            SELECT {columns} FROM locations WHERE visited_at < ?
+        """, (cutoff,)).rowcount
+        conn.execute("DELETE FROM locations WHERE visited_at < ?", (cutoff,))
+        conn.execute(
+            "INSERT INTO archive_runs (archived_at, cutoff, visits) VALUES (?, ?, ?)",
+            (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), before.strftime("%Y-%m-%d %H:%M:%S"), moved)
+        )
+        conn.execute("COMMIT")
+    except sqlite3.Error:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    return moved
+
+def network_extent():
+    """Return (count, mean lat, mean lon) of all customers from the summary table"""
+    return query_one("""
+        SELECT COALESCE(SUM(visits), 0), SUM(lat_sum) / SUM(visits), SUM(lon_sum) / SUM(visits)
+        FROM visit_summary
+    """)
+
+def visit_summary():
+    """Visit counts per customer type and day (YYYY-MM-DD)"""
+    return query_frame("SELECT type, day, visits FROM visit_summary")
+
+def customers_within(lat, lon, radius_km):
+    """Customers within radius_km of a point, nearest first, with a distance_km column"""
+    candidates = load_in_bounds(*bbox_around(lat, lon, radius_km))
+    candidates["distance_km"] = haversine_km(lat, lon, candidates["lat"], candidates["lon"])
+    found = candidates[candidates["distance_km"] <= radius_km]
+    return found.sort_values("distance_km", kind="stable").reset_index(drop=True)
+
+def nearest_customers(lat, lon, k=5, max_km=NEAREST_MAX_KM):
+    """The k customers closest to a point, searching outwards up to max_km"""
+    radius_km = min(NEAREST_START_KM, max_km)
+    while True:
+        # Everything inside the circle is found, so k hits there are the true k nearest
+        found = customers_within(lat, lon, radius_km)
+        if len(found) >= k or radius_km >= max_km:
+            return found.head(k)
+        radius_km = min(radius_km * 4, max_km)
@@ -0,0 +1,181 @@
+import threading
+from collections import OrderedDict
+
+import folium
+import numpy as np
+import pandas as pd
+from folium.plugins import MarkerCluster
+from folium.template import Template
+
+# Above this many rows maps switch from one folium.Marker per row to a single bulk layer
+BULK_MARKER_THRESHOLD = 1000
+
+def use_bulk_markers(data, threshold=None):
+    """Return True when a frame is large enough to need the bulk marker layer"""
+    return len(data) > (BULK_MARKER_THRESHOLD if threshold is None else threshold)
+
+def lookup(values, table, default):
+    """Map a column through a lookup table, falling back to a default"""
+    return pd.Series(values, dtype=object).map(table).fillna(default)
+
+class ColumnarMarkerLayer(MarkerCluster):
+    """Clustered marker layer drawn in the browser from column arrays.
+
+    Instead of one folium.Marker per row, the layer ships each column once
+    (lat, lon, a style code, tooltip, popup) plus a small table of distinct
+    (color, icon) pairs that the style codes index into.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = (function(){
+                var cols = {{ this.columns|tojson }};
+                var styles = {{ this.styles|tojson }}.map(function(s) {
+                    return L.AwesomeMarkers.icon({markerColor: s[0], icon: s[1], prefix: 'glyphicon'});
+                });
+                var cluster = L.markerClusterGroup({{ this.options|tojavascript }});
+                for (var i = 0; i < cols.lat.length; i++) {
+                    var marker = L.marker([cols.lat[i], cols.lon[i]], {icon: styles[cols.style[i]]});
+                    if (cols.tooltip) { marker.bindTooltip(cols.tooltip[i]); }
+                    if (cols.popup) { marker.bindPopup(cols.popup[i], {maxWidth: 300}); }
+                    cluster.addLayer(marker);
+                }
+                cluster.addTo({{ this._parent.get_name() }});
+                return cluster;
+            })();
+        {% endmacro %}""")
+
+    def __init__(self, lat, lon, color, icon="info-sign", tooltip=None, popup=None,
+                 name=None, **kwargs):
+        super().__init__(name=name, **kwargs)
+        self._name = "ColumnarMarkerLayer"
+
+        lat = np.asarray(lat, dtype=float)
+        lon = np.asarray(lon, dtype=float)
+        color = np.broadcast_to(np.asarray(color, dtype=object), lat.shape)
+        icon = np.broadcast_to(np.asarray(icon, dtype=object), lat.shape)
+
+        # Factorize (color, icon) pairs so each row carries a small integer code
+        codes, styles = pd.MultiIndex.from_arrays([color, icon]).factorize()
+
+        self.styles = [list(style) for style in styles]
+        self.columns = {"lat": lat.tolist(), "lon": lon.tolist(), "style": codes.tolist()}
+        if tooltip is not None:
+            self.columns["tooltip"] = pd.Series(tooltip).astype(str).tolist()
+        if popup is not None:
+            self.columns["popup"] = pd.Series(popup).astype(str).tolist()
+
+# Numbered badge drawn at each stop of a planned route
+ROUTE_STOP_HTML = (
+    '<div style="background:#1f6feb;color:white;border-radius:50%;width:22px;height:22px;'
+    'line-height:22px;text-align:center;font:bold 11px sans-serif;border:2px solid white">{}</div>'
+)
+
+def route_layer(lat, lon, labels, start=None, name="Route"):
+    """Feature group with a route's path and numbered stops, in visiting order"""
+    group = folium.FeatureGroup(name=name)
+    path = list(zip(lat, lon))
+    if start is not None:
+        path.insert(0, tuple(start))
+        folium.Marker(start, tooltip="Start", icon=folium.Icon(color="blue", icon="user")).add_to(group)
+    if len(path) > 1:
+        folium.PolyLine(path, color="#1f6feb", weight=4, opacity=0.7).add_to(group)
+    for number, (stop_lat, stop_lon, label) in enumerate(zip(lat, lon, labels), start=1):
+        folium.Marker(
+            [stop_lat, stop_lon],
+            tooltip=f"{number}. {label}",
+            icon=folium.DivIcon(html=ROUTE_STOP_HTML.format(number), icon_size=(26, 26), icon_anchor=(13, 13))
+        ).add_to(group)
+    return group
+
+# Heatmap cells are about this many screen pixels wide at the zoom they were binned for
+HEATMAP_CELL_PX = 8
+HEATMAP_ZOOMS = tuple(range(4, 20, 2))
+
+def _cell_size(zoom, cell_px=HEATMAP_CELL_PX):
+    """Width in degrees of a heatmap cell at a web-mercator zoom level"""
+    return 360 / (256 * 2 ** zoom) * cell_px
+
+def build_heat_pyramid(lat, lon, zooms=HEATMAP_ZOOMS):
+    """Bin points into weighted grid cells at several zoom levels.
+
+    The finest level is binned from the raw points; each coarser level is
+    rebinned from the integer cell indices of the one below it, so the
+    whole pyramid costs one pass over the points plus passes over cells.
+    Returns {zoom: (cell lat, cell lon, point count)} arrays.
+    """
+    zooms = sorted(zooms, reverse=True)
+    finest = _cell_size(zooms[0])
+    row = np.floor(np.asarray(lat, dtype=float) / finest).astype(np.int64)
+    col = np.floor(np.asarray(lon, dtype=float) / finest).astype(np.int64)
+    weight = np.ones(len(row), dtype=np.int64)
+
+    pyramid = {}
+    for zoom in zooms:
+        factor = 2 ** (zooms[0] - zoom)
+        level_row, level_col = row // factor, col // factor
+
+        # Pack each (row, col) pair into one int64 key so np.unique works on a flat array
+        row_min, col_min = level_row.min(), level_col.min()
+        span = level_col.max() - col_min + 1
+        keys, inverse = np.unique((level_row - row_min) * span + (level_col - col_min), return_inverse=True)
+        counts = np.bincount(inverse, weights=weight, minlength=len(keys))
+        cell_row, cell_col = keys // span + row_min, keys % span + col_min
+
+        size = _cell_size(zoom)
+        pyramid[zoom] = ((cell_row + 0.5) * size, (cell_col + 0.5) * size, counts)
+
+        # Carry the coarser cells forward so the next level bins cells, not points
+        row, col, weight = cell_row * factor, cell_col * factor, counts
+    return pyramid
+
+def heat_cells(pyramid, zoom, bounds):
+    """Return [lat, lon, weight] for the cells visible at a zoom and bounding box"""
+    levels = sorted(pyramid)
+    level = max((z for z in levels if z <= zoom), default=levels[0])
+    lat, lon, counts = pyramid[level]
+
+    south, west, north, east = bounds
+    visible = (lat >= south) & (lat <= north) & (lon >= west) & (lon <= east)
+    if not visible.any():
+        return []
+
+    weight = counts[visible] / counts[visible].max()
+    return np.column_stack([lat[visible], lon[visible], weight]).tolist()
+
+# Rendered maps kept per process; whichever limit is hit first evicts the oldest
+RENDER_CACHE_ENTRIES = 32
+RENDER_CACHE_MB = 256
+
+class RenderCache:
+    """LRU cache of rendered map HTML keyed by a data version and filter state.
+
+    A map only changes when the data or the filters behind it do, so reruns
+    caused by anything else (search, paging, ...) get the HTML back without
+    building or rendering the folium map again.
+    """
+
+    def __init__(self, max_entries=RENDER_CACHE_ENTRIES, max_mb=RENDER_CACHE_MB):
+        self.max_entries = max_entries
+        self.max_bytes = max_mb * 1024 * 1024
+        self.size_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, version, state, render):
+        """HTML for (version, state), calling render() on a miss"""
+        key = (version, state)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+        html = render()
+        with self._lock:
+            if key not in self._entries and len(html) <= self.max_bytes:
+                self._entries[key] = html
+                self.size_bytes += len(html)
+                while len(self._entries) > self.max_entries or self.size_bytes > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self.size_bytes -= len(evicted)
+        return html
@@ -0,0 +1,76 @@
+import numpy as np
+
+from geo import haversine_km
+
+# 2-opt stops after this many passes even if it is still finding small gains
+MAX_IMPROVEMENT_PASSES = 50
+
+def distance_matrix(lat, lon):
+    """Pairwise great-circle distances in km between all stops"""
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    return haversine_km(lat[:, None], lon[:, None], lat[None, :], lon[None, :])
+
+def nearest_neighbour_tour(dist, start=0):
+    """Visit order that always goes to the closest stop not yet visited"""
+    n = len(dist)
+    tour = np.empty(n, dtype=np.int64)
+    visited = np.zeros(n, dtype=bool)
+    tour[0] = start
+    visited[start] = True
+    for i in range(1, n):
+        row = np.where(visited, np.inf, dist[tour[i - 1]])
+        tour[i] = np.argmin(row)
+        visited[tour[i]] = True
+    return tour
+
+def two_opt(tour, dist, max_passes=MAX_IMPROVEMENT_PASSES):
+    """Improve an open path by reversing segments while that shortens it.
+
+    The first stop stays in place. For each edge (a, b) every candidate
+    edge (c, d) further along is scored in one vectorized step, and the
+    best reversal is applied before moving on.
+    """
+    tour = np.array(tour, dtype=np.int64)
+    n = len(tour)
+    for _ in range(max_passes):
+        improved = False
+        for i in range(n - 2):
+            a, b = tour[i], tour[i + 1]
+            c = tour[i + 2:]
+            d = np.append(tour[i + 3:], -1)  # -1: c is the last stop, so there is no edge after it
+            has_d = d >= 0
+            d = np.where(has_d, d, 0)
+            gain = (dist[a, b] + np.where(has_d, dist[c, d], 0)) - (dist[a, c] + np.where(has_d, dist[b, d], 0))
+            k = np.argmax(gain)
+            if gain[k] > 1e-9:
+                tour[i + 1:i + 3 + k] = tour[i + 1:i + 3 + k][::-1]
+                improved = True
+        if not improved:
+            break
+    return tour
+
+def route_length(tour, dist):
+    """Total km of an open path"""
+    return float(dist[tour[:-1], tour[1:]].sum())
+
+def plan_route(lat, lon, start=None):
+    """Short visit order through the stops, optionally from a (lat, lon) starting point.
+
+    Returns (order, km): positions into lat/lon in visiting order and the
+    length of the path, including the leg from the start point.
+    """
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    if start is not None:
+        lat = np.append(start[0], lat)
+        lon = np.append(start[1], lon)
+    if len(lat) == 0:
+        return np.empty(0, dtype=np.int64), 0.0
+
+    dist = distance_matrix(lat, lon)
+    tour = two_opt(nearest_neighbour_tour(dist), dist)
+    km = route_length(tour, dist)
+    if start is not None:
+        tour = tour[1:] - 1
+    return tour, km
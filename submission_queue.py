@@ -0,0 +1,223 @@
+import argparse
+import hashlib
+import json
+import logging
+import sqlite3
+import sys
+import threading
+import uuid
+from datetime import datetime
+
+import streamlit as st
+
+import locations_db
+from geocode import locate
+from locations_db import LOCATION_COLUMNS, connect, init_db
+
+# Configuration
+QUEUE_DB = "submission_queue.db"
+FLUSH_BATCH_MAX = 500
+FLUSH_INTERVAL_S = 5       # also retry anything left over this often
+RETRY_MAX_DELAY_S = 300
+MAX_ATTEMPTS = 5           # after this many failed inserts a submission is parked as failed
+# What makes two form submissions the same visit; the submit time is left out on purpose
+SUBMISSION_FIELDS = ("name", "phone", "type", "address", "lat", "lon", "notes")
+
+logger = logging.getLogger(__name__)
+
+def _connect_queue():
+    """Open the queue file; synchronous=FULL so an acknowledged submission survives power loss"""
+    conn = sqlite3.connect(QUEUE_DB, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = FULL")
+    conn.execute("PRAGMA busy_timeout = 5000")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS submissions (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            key TEXT NOT NULL UNIQUE,
+            payload TEXT NOT NULL,
+            queued_at TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            failed_at TEXT
+        )
+    """)
+    return conn
+
+def enqueue_visit(record, key=None):
+    """Durably queue a visit for the locations table and return its idempotency key.
+
+    Queuing the same key twice keeps the first submission, and the key is
+    stored with the row, so a visit is inserted once however often it is
+    submitted or flushed.
+    """
+    key = key or uuid.uuid4().hex
+    payload = json.dumps({column: record.get(column) for column in LOCATION_COLUMNS})
+    conn = _connect_queue()
+    try:
+        conn.execute(
+            "INSERT INTO submissions (key, payload, queued_at) VALUES (?, ?, ?) ON CONFLICT (key) DO NOTHING",
+            (key, payload, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        )
+    finally:
+        conn.close()
+    start_flusher()
+    return key
+
+def submission_key(record, session_id):
+    """Idempotency key for a form submission: the same visit from the same session hashes alike"""
+    fields = [record.get(field) for field in SUBMISSION_FIELDS]
+    return hashlib.sha256(json.dumps([session_id, *fields], default=str).encode()).hexdigest()
+
+def submit_visit(record):
+    """Queue a visit from a capture page and return its key.
+
+    The key is derived from the visit's fields and the browser session rather
+    than the submit time, so pressing Save twice, or again after an error,
+    queues the visit once.
+    """
+    session_id = st.session_state.setdefault("submission_session", uuid.uuid4().hex)
+    return enqueue_visit(record, key=submission_key(record, session_id))
+
+def pending_visits():
+    """Number of queued visits not yet in the locations table (failed ones excluded)"""
+    conn = _connect_queue()
+    try:
+        return conn.execute("SELECT COUNT(*) FROM submissions WHERE failed_at IS NULL").fetchone()[0]
+    finally:
+        conn.close()
+
+def flush_batch(queue_conn, db_conn, limit=FLUSH_BATCH_MAX):
+    """Move up to `limit` queued visits into locations in one transaction; returns how many were taken"""
+    batch = queue_conn.execute(
+        "SELECT seq, key, payload FROM submissions WHERE failed_at IS NULL ORDER BY seq LIMIT ?", (limit,)
+    ).fetchall()
+    if not batch:
+        return 0
+
+    # A payload that can't be read is rejected like a failed insert, so it can't stall the queue
+    rows, failed = [], []
+    for seq, key, payload in batch:
+        try:
+            record = json.loads(payload)
+            record["lat"], record["lon"] = float(record["lat"]), float(record["lon"])
+        except Exception as e:
+            failed.append((f"{type(e).__name__}: {e}", seq))
+            continue
+        rows.append((seq, key, record))
+
+    # Tag the whole batch with province/district at once where the form didn't
+    untagged = [record for _, _, record in rows if record.get("province") is None]
+    if untagged:
+        province, district = locate([r["lat"] for r in untagged], [r["lon"] for r in untagged])
+        for record, p, d in zip(untagged, province, district):
+            record.update(province=p, district=d)
+
+    columns = LOCATION_COLUMNS + ("submission_id",)
+    # Skip keys already in locations, or moved from it to the archive
+    sql = f"""
+        INSERT INTO locations ({', '.join(columns)})
+        SELECT {', '.join('?' * len(columns))}
+        WHERE NOT EXISTS (SELECT 1 FROM locations_archive WHERE submission_id = ?)
+        ON CONFLICT (submission_id) DO NOTHING
+    """
+    done = []
+    db_conn.execute("BEGIN IMMEDIATE")
+    try:
+        for seq, key, record in rows:
+            db_conn.execute("SAVEPOINT submission")
+            try:
+                db_conn.execute(sql, tuple(record.get(column) for column in LOCATION_COLUMNS) + (key, key))
+                db_conn.execute("RELEASE submission")
+                done.append(seq)
+            except Exception as e:
+                db_conn.execute("ROLLBACK TO submission")
+                db_conn.execute("RELEASE submission")
+                failed.append((f"{type(e).__name__}: {e}", seq))
+        db_conn.execute("COMMIT")
+    except sqlite3.Error:
+        if db_conn.in_transaction:
+            db_conn.execute("ROLLBACK")
+        raise
+
+    # Committed rows are only dropped from the queue now; if this step is lost
+    # they are flushed again and skipped by their submission_id
+    queue_conn.execute("BEGIN IMMEDIATE")
+    queue_conn.executemany("DELETE FROM submissions WHERE seq = ?", ((seq,) for seq in done))
+    queue_conn.executemany("""
+        UPDATE submissions
+        SET attempts = attempts + 1, last_error = ?,
+            failed_at = CASE WHEN attempts + 1 >= ? THEN datetime('now', 'localtime') END
+        WHERE seq = ?
+    """, ((error, MAX_ATTEMPTS, seq) for error, seq in failed))
+    queue_conn.execute("COMMIT")
+    for error, seq in failed:
+        logger.warning("Queued visit %s was rejected: %s", seq, error)
+    return len(batch)
+
+def flush_pending():
+    """Drain the queue into locations, batch by batch; returns how many were taken"""
+    queue_conn, db_conn = _connect_queue(), connect()
+    try:
+        total = 0
+        while True:
+            taken = flush_batch(queue_conn, db_conn)
+            total += taken
+            if taken < FLUSH_BATCH_MAX:
+                return total
+    finally:
+        queue_conn.close()
+        db_conn.close()
+
+# --- Background flusher ---
+_wake = threading.Event()
+_flusher_lock = threading.Lock()
+_flusher_thread = None
+
+def _flusher_loop():
+    """Flush whenever woken (or every FLUSH_INTERVAL_S), backing off while the database fails"""
+    delay = FLUSH_INTERVAL_S
+    initialized = None
+    while True:
+        _wake.wait(timeout=delay)
+        _wake.clear()
+        try:
+            if initialized != locations_db.DB_NAME:
+                init_db()
+                initialized = locations_db.DB_NAME
+            flush_pending()
+            delay = FLUSH_INTERVAL_S
+        except Exception:
+            delay = min(delay * 2, RETRY_MAX_DELAY_S)
+            logger.exception("Flushing queued visits failed; retrying in %s s", delay)
+
+def start_flusher():
+    """Start the flusher thread if needed and have it flush now"""
+    global _flusher_thread
+    with _flusher_lock:
+        if _flusher_thread is None or not _flusher_thread.is_alive():
+            _flusher_thread = threading.Thread(target=_flusher_loop, name="visit-queue-flusher", daemon=True)
+            _flusher_thread.start()
+    _wake.set()
+
+@st.cache_resource
+def resume_flusher():
+    """Start the flusher on page load, once per server process, so visits queued before a restart get flushed"""
+    start_flusher()
+
+def main(argv=None):
+    global QUEUE_DB
+    parser = argparse.ArgumentParser(description="Flush queued visit submissions into the locations table")
+    parser.add_argument("--db", default=locations_db.DB_NAME, help="SQLite database file")
+    parser.add_argument("--queue", default=QUEUE_DB, help="submission queue file")
+    args = parser.parse_args(argv)
+
+    locations_db.DB_NAME = args.db
+    QUEUE_DB = args.queue
+    init_db()
+    flushed = flush_pending()
+    print(f"Flushed {flushed:,} queued visits; {pending_visits():,} still pending")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
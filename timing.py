@@ -0,0 +1,112 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+import pandas as pd
+import streamlit as st
+
+# Configuration (environment overrides let ops switch it on without a deploy)
+SAMPLE_RATE = float(os.environ.get("PORTAL_TIMING_SAMPLE_RATE", "0"))  # share of reruns logged
+DEV_PANEL = os.environ.get("PORTAL_TIMING_PANEL", "") == "1"           # per-rerun table in the sidebar
+LOG_PATH = os.environ.get("PORTAL_TIMING_LOG", "timings.jsonl")
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUPS = 5
+
+_logger = logging.getLogger("portal.timing")
+_logger.propagate = False
+_logger_lock = threading.Lock()
+
+def _timing_logger():
+    """JSONL logger over a rotating file, set up on first use"""
+    with _logger_lock:
+        if not _logger.handlers:
+            handler = RotatingFileHandler(LOG_PATH, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            _logger.addHandler(handler)
+            _logger.setLevel(logging.INFO)
+    return _logger
+
+class _Span:
+    """Times one phase; attributes set on it (rows, payload_bytes, ...) are logged with it"""
+
+    def __init__(self, rerun, name):
+        self.rerun = rerun
+        self.record = {"name": name}
+
+    def __setitem__(self, key, value):
+        self.record[key] = value
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.record["ms"] = round((time.perf_counter() - self.start) * 1000, 3)
+        self.rerun.spans.append(self.record)
+        return False
+
+class Rerun:
+    """Spans collected over one script run of a sampled session"""
+    sampled = True
+
+    def __init__(self, page, log=True):
+        self.page = page
+        self.log = log
+        self.started = datetime.now()
+        self.start = time.perf_counter()
+        self.spans = []
+
+    def span(self, name):
+        return _Span(self, name)
+
+    def finish(self):
+        """Log the run and, if enabled, show it in the sidebar"""
+        total_ms = round((time.perf_counter() - self.start) * 1000, 3)
+        if self.log:
+            _timing_logger().info(json.dumps({
+                "ts": self.started.isoformat(timespec="milliseconds"),
+                "page": self.page,
+                "total_ms": total_ms,
+                "spans": self.spans,
+            }, default=str))
+        if DEV_PANEL:
+            with st.sidebar.expander(f"⏱️ Timings ({total_ms:,.0f} ms)"):
+                st.dataframe(pd.DataFrame(self.spans), hide_index=True)
+
+class _NullSpan:
+    def __setitem__(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+class _NullRerun:
+    """Stand-in for unsampled runs: every call is a no-op"""
+    sampled = False
+    _span = _NullSpan()
+
+    def span(self, name):
+        return self._span
+
+    def finish(self):
+        pass
+
+_NULL_RERUN = _NullRerun()
+
+def start_rerun(page):
+    """Begin timing a script run, or a no-op stand-in when it is not sampled.
+
+    Runs that end early (st.stop, st.rerun) never reach finish() and are not logged.
+    """
+    log = SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE
+    if log or DEV_PANEL:
+        return Rerun(page, log)
+    return _NULL_RERUN